@@ -1,2 +1,2 @@
 from .loader import load_config
-from .models import AIMafiaConfig, ChatskyConfig, DBConfig
+from .models import AIMafiaConfig, ChatskyConfig, DBConfig, HTTPConfig, TelegramConfig
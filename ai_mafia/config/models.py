@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
@@ -6,6 +8,42 @@ class DBConfig(BaseModel):
     host: str
     port: int
     name: str
+    max_pool_size: int = 100
+    """Max number of connections to the database kept by one process."""
+    min_pool_size: int = 0
+    """Number of connections to the database kept open even when idle."""
+    server_selection_timeout_ms: int = 5000
+    """How long a query waits for an available server before failing."""
+    write_concern: int | str = 1
+    """``w`` option of the client: number of nodes to acknowledge a write or ``"majority"``."""
+    read_preference: str = "primary"
+    """pymongo read preference mode, e.g. ``"primary"`` or ``"secondaryPreferred"``."""
+    cache_size: int = 1024
+    """Max number of rooms kept in the process-wide room cache."""
+    cache_ttl: float = 5.0
+    """Seconds a cached room lives when there is no change stream to invalidate it."""
+    cas_retries: int = 5
+    """How many times a compare-and-set write to a room is retried after losing to a concurrent write."""
+    event_batch_size: int = 100
+    """Number of buffered game events that triggers a write to the event log."""
+    event_flush_interval: float = 1.0
+    """Max seconds a game event stays buffered before it is written to the event log."""
+    recovery_window: float = 1800
+    """Started games with no activity for longer than this many seconds are not recovered after a restart,
+    unless they have a pending phase timer.
+    """
+    idle_room_ttl: float = 3600
+    """Seconds after the last activity when an open room is deleted."""
+    archive_after: float = 600
+    """Seconds after the end of a game when its room is moved to the archive collection."""
+    maintenance_interval: float = 300
+    """Seconds between runs of the task that archives and expires rooms."""
+    maintenance_batch_size: int = 1000
+    """Max number of rooms archived or expired by one run of the maintenance task."""
+    backend: Literal["mongo", "memory"] = "mongo"
+    """Storage engine behind :py:mod:`ai_mafia.db.async_routines`.
+    ``"memory"`` needs no database server, but its data is private to one process and lost on exit.
+    """
 
     @property
     def address(self):
@@ -24,13 +62,65 @@ class EndpointConfig(BaseModel):
         return self.address + name
 
 
-class ChatskyConfig(EndpointConfig): ...
+class ChatskyConfig(EndpointConfig):
+    broadcast_concurrency: int = 8
+    """Max number of script turns run at once by room broadcasts of the process, see :py:func:`broadcast`."""
+    in_process: bool = False
+    """Receive Telegram updates by polling in the script process and hand them to the script directly,
+    instead of running ``tg_proxy.py`` as a separate process that forwards them to ``/chat``.
+    """
 
 
 class SynchronizerConfig(EndpointConfig): ...
 
 
+class HTTPConfig(BaseModel):
+    """Options of the HTTP client shared by calls between our services, see :py:mod:`ai_mafia.http_client`."""
+
+    timeout: float = 5.0
+    """Seconds to wait for a response."""
+    connect_timeout: float = 2.0
+    """Seconds to wait for a connection to be established."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    """Number of idle connections kept open for reuse."""
+    retries: int = 3
+    """How many times a failed request is repeated."""
+    backoff: float = 0.1
+    """Base of the exponential backoff between retries in seconds. The actual delay is random up to that value."""
+
+
+class TelegramConfig(BaseModel):
+    """Options of the bot: how it receives updates and limits of sent messages (:py:mod:`ai_mafia.tg_proxy.outbox`)."""
+
+    rate_limit: float = 30
+    """Max messages per second to all chats."""
+    chat_rate_limit: float = 1.0
+    """Max messages per second to one chat in the long run."""
+    chat_burst: int = 3
+    """Number of messages that can be sent to one chat at once before ``chat_rate_limit`` applies."""
+    send_retries: int = 3
+    """How many times sending a message is repeated after a network or rate limit error."""
+    backoff: float = 0.5
+    """Base of the exponential backoff between retries after a network error in seconds."""
+    latency_window: int = 1000
+    """Number of last sent messages the latency metrics are computed over."""
+    mode: Literal["polling", "webhook"] = "polling"
+    """How ``tg_proxy.py`` receives updates: by long polling in one process,
+    or as a webhook served by ``webhook_workers`` processes, possibly behind a load balancer.
+    """
+    webhook_url: str = ""
+    """Public HTTPS address Telegram posts updates to. It must be routed to ``/telegram`` of the webhook workers."""
+    webhook_host: str = "localhost"
+    webhook_port: int = 8443
+    webhook_workers: int = 1
+    webhook_max_connections: int = 40
+    """Max number of concurrent requests Telegram sends to the webhook."""
+
+
 class AIMafiaConfig(BaseModel):
     db: DBConfig
     chatsky: ChatskyConfig
     sync: SynchronizerConfig
+    http: HTTPConfig = HTTPConfig()
+    telegram: TelegramConfig = TelegramConfig()
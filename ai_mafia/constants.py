@@ -1,2 +1,4 @@
 N_PLAYERS = 2
 NUM_PLAYERS = [str(i + 1) for i in range(N_PLAYERS)]
+MAX_PLAYERS = 10
+"""Number of seats in a game room, one for each role."""
@@ -0,0 +1,398 @@
+"""
+Asyncio counterpart of :py:mod:`ai_mafia.db.routines` with the same API.
+
+Use it from chatsky handlers and other coroutines, so that a database round-trip
+does not block the event loop that serves every player.
+The data itself is kept by the storage engine selected in config (see :py:mod:`ai_mafia.db.storage`).
+"""
+
+import asyncio
+import logging
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from bson.objectid import ObjectId
+from chatsky import Context
+from chatsky.core.context import get_last_index
+from pymongo.errors import PyMongoError
+
+from ai_mafia.config import load_config
+from ai_mafia.constants import N_PLAYERS
+from ai_mafia.types import EventKind, GamePhase, PlayerRole, PlayerState, RoomState
+
+from .cache import room_cache, write_through
+from .events import event_log
+from .matchmaking import matchmaker
+from .models import PlayerModel, RoomModel, UserModel
+from .readiness import readiness
+from .snapshot import room_generation
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+config = load_config().db
+
+cas_conflicts: Counter[str] = Counter()
+"""Number of compare-and-set writes that lost to a concurrent write, by routine."""
+
+
+async def find_user(tg_id: int) -> UserModel | None:
+    """
+    If info about this tg user is stored in our database,
+    return it. Otherwise, return None.
+    """
+    return await get_storage().users.find_by_tg_id(tg_id)
+
+
+async def add_user(tg_id: int, tg_nickname: str) -> UserModel:
+    """Add info about user to database and return full info about him."""
+    user = UserModel(tg_id=tg_id, tg_nickname=tg_nickname)
+    user.db_id = await get_storage().users.insert(user)
+    return user
+
+
+async def get_tg_username(db_id: ObjectId) -> str:
+    return await get_storage().users.get_nickname(db_id)
+
+
+async def increment_counter(db_id: ObjectId) -> int:
+    """Increment win counter for a given user by 1 and return resulting value."""
+    return await get_storage().users.increment_win_counter(db_id)
+
+
+async def get_counter(db_id: ObjectId) -> int:
+    """Find and return win counter for a given user."""
+    return await get_storage().users.get_win_counter(db_id)
+
+
+async def find_game_room(room_id: str) -> RoomModel | None:
+    """
+    If info about this game room is stored in our database,
+    return it. Otherwise, return None.
+    """
+    room = room_cache.get(room_id)
+    if room is not None:
+        return room
+    room = await get_storage().rooms.find_by_room_id(room_id)
+    if room is not None:
+        room_cache.put(room)
+    return room
+
+
+async def room_snapshot(ctx: Context) -> RoomModel | None:
+    """
+    Return the room stored in ``ctx.misc["room_info"]`` as of the current pipeline turn.
+
+    The room is read once per turn and reused by every handler of this turn,
+    unless some write routine has touched the room since then.
+    """
+    room_info: RoomModel = ctx.misc["room_info"]
+    turn_id = get_last_index(ctx.requests)
+    generation = room_generation(room_info.db_id)
+
+    snapshot = ctx.misc.get("room_snapshot")
+    if snapshot is not None and snapshot["turn_id"] == turn_id and snapshot["generation"] == generation:
+        return snapshot["room"]
+
+    room = await find_game_room(room_info.room_id)
+    ctx.misc["room_snapshot"] = {"turn_id": turn_id, "generation": generation, "room": room}
+    return room
+
+
+async def watch_room_changes():
+    """
+    Keep the room cache, the matchmaker and readiness events consistent with writes made by other processes.
+    Runs until cancelled.
+
+    Needs a replica set. On a standalone server the cache falls back to expiring entries by TTL.
+    """
+    try:
+        room_cache.watching = True
+        async for room_db_id, room in get_storage().rooms.watch():
+            if room is None:
+                room_cache.invalidate(room_db_id)
+                matchmaker.remove(room_db_id)
+                readiness.discard(room_db_id)
+                continue
+            cached_version = room_cache.version(room_db_id)
+            if cached_version is not None:
+                if cached_version >= room.version:
+                    # an echo of a write of this process, or a change overtaken by a write it has already seen
+                    continue
+                room_cache.put(room)
+            matchmaker.update(room)
+            readiness.update(room)
+    except PyMongoError:
+        logger.warning("Room change stream is not available, room cache falls back to TTL", exc_info=True)
+    finally:
+        room_cache.watching = False
+        room_cache.clear()
+
+
+async def rebuild_matchmaker():
+    """Fill the matchmaker with open rooms stored in database. Called on startup."""
+    matchmaker.clear()
+    for room in await get_storage().rooms.find_by_state(RoomState.CREATED):
+        matchmaker.update(room)
+
+
+async def run_maintenance() -> dict[str, int]:
+    """
+    Move rooms of ended games to the archive and delete open rooms nobody has touched for a long time.
+    Return the number of rooms archived and expired.
+    """
+    now = datetime.now(timezone.utc)
+    rooms = get_storage().rooms
+    archived = await rooms.archive_ended_rooms(
+        now - timedelta(seconds=config.archive_after), config.maintenance_batch_size
+    )
+    expired = await rooms.expire_idle_rooms(
+        now - timedelta(seconds=config.idle_room_ttl), config.maintenance_batch_size
+    )
+    for room_db_id in archived + expired:
+        room_cache.invalidate(room_db_id)
+        matchmaker.remove(room_db_id)
+        readiness.discard(room_db_id)
+    report = {"archived": len(archived), "expired": len(expired)}
+    logger.info("Room maintenance: %(archived)d archived, %(expired)d expired", report)
+    return report
+
+
+async def maintain_rooms():
+    """Call :py:func:`run_maintenance` every ``db.maintenance_interval`` seconds. Runs until cancelled."""
+    while True:
+        try:
+            await run_maintenance()
+        except PyMongoError:
+            logger.warning("Room maintenance failed, will retry", exc_info=True)
+        await asyncio.sleep(config.maintenance_interval)
+
+
+async def add_room(name_room: str) -> RoomModel:
+    """Add new game room and store info in database, return created room"""
+    room = RoomModel(name=name_room, room_id=str(uuid4().hex))
+    room.db_id = await get_storage().rooms.insert(room)
+    return write_through(room)
+
+
+async def get_random_room() -> RoomModel | None:
+    """
+    If any game room open, randomly return one of them, preferring the fuller ones.
+    Otherwise, return None.
+    """
+    room = await get_storage().rooms.sample_open_room()
+    if room is not None:
+        room_cache.put(room)
+    return room
+
+
+async def find_open_room() -> RoomModel | None:
+    """
+    Same as :py:func:`get_random_room`, but the room is picked by the in-memory matchmaker.
+    Database is queried only if the matchmaker knows no open room.
+    """
+    while (open_room := matchmaker.pick()) is not None:
+        room = await find_game_room(open_room.room_id)
+        if room is not None and room.room_state == RoomState.CREATED:
+            return room
+        # the room has been started or deleted by another process
+        matchmaker.remove(open_room.room_db_id)
+    return await get_random_room()
+
+
+async def set_player_state(user_db_id: ObjectId, room_db_id: ObjectId, state: PlayerState) -> RoomModel:
+    """Mark user as ready and return updated room model"""
+    room = await get_storage().rooms.set_player_state(user_db_id, room_db_id, state)
+    if room is None:
+        await _raise_not_found(room_db_id, "Something's wrong. Player not found")
+    return write_through(room)
+
+
+async def show_rooms():
+    for room in await get_storage().rooms.find_all():
+        print(room)
+
+
+async def is_room_ready(room_db_id: ObjectId):
+    """
+    Check whether all players of the room are ready
+    """
+    room_model = await get_storage().rooms.find_by_db_id(room_db_id)
+    if room_model is None:
+        msg = "Something's wrong. Room not found"
+        raise RuntimeError(msg)
+    return room_model.is_room_ready(N_PLAYERS)
+
+
+async def join_room(user_db_id: ObjectId, room_db_id: ObjectId, ctx_id: str, chat_id: int) -> RoomModel | None:
+    """
+    Add user to the room and return updated room model.
+    Return None if the room is full or the game has already started.
+    Joining the same room twice does not add the user again.
+    """
+    player = PlayerModel(user_id=str(user_db_id), ctx_id=ctx_id, chat_id=chat_id)
+    if not matchmaker.reserve(room_db_id, player.user_id):
+        return None
+    rooms = get_storage().rooms
+    try:
+        room = await rooms.join(player, room_db_id)
+    except BaseException:
+        # if the write went through after all, the seat comes back with the next update of the room
+        matchmaker.release(room_db_id, player.user_id)
+        raise
+    if room is not None:
+        return write_through(room)
+
+    # the join was rejected, find out why
+    matchmaker.release(room_db_id, player.user_id)
+    room = await rooms.find_by_db_id(room_db_id)
+    if room is None:
+        msg = "Something's wrong. Room not found"
+        raise RuntimeError(msg)
+    room_cache.put(room)
+    matchmaker.update(room)
+    if room.get_player(player.user_id) is not None:
+        return room
+    return None
+
+
+async def exit_room(user_db_id: ObjectId, room_db_id: ObjectId):
+    room = await get_storage().rooms.exit(user_db_id, room_db_id)
+    if room is None:
+        await _raise_not_found(room_db_id, "Something's wrong. User not found in the room")
+    write_through(room)
+
+
+async def start_game(room_db_id: ObjectId) -> bool:
+    """
+    Deal shuffled roles and numbers to the players and mark the room as started.
+    Return False if the game has already been started by someone else.
+    """
+    roles = PlayerRole.all_roles()
+    random.shuffle(roles)
+    room = await get_storage().rooms.start_game(room_db_id, roles)
+    if room is None:
+        return False
+    write_through(room)
+    return True
+
+
+async def shoot(room_db_id: ObjectId, player_number: int):
+    room = await get_storage().rooms.shoot(room_db_id, player_number)
+    if room is not None:
+        write_through(room)
+
+
+async def murder(room_id: str) -> bool:
+    """
+    Mark the player shot by every alive black player as pre-dead and reset all shoot counters.
+    Return True if somebody was killed.
+    """
+    room = await get_storage().rooms.murder(room_id)
+    if room is None:
+        msg = "Something's wrong. Room not found"
+        raise RuntimeError(msg)
+    # replay the same transition on the state we have overwritten
+    # to find out whether somebody was killed and to get the updated room
+    res = room.kill()
+    room.version += 1
+    write_through(room)
+    if res:
+        event_log.append(room_id, EventKind.DEATH, target=room.get_pre_dead_player().number)
+    return res
+
+
+async def settle_game(room: RoomModel) -> RoomModel | None:
+    """
+    Update win and game counters of all participants of a finished game and mark it as ended.
+    Return the ended room, or None if the game is not over yet or is ended by someone else.
+    """
+    storage = get_storage()
+    # the winners are decided by the stored room, not by the copy of the caller, which may be behind
+    room = await storage.rooms.find_by_db_id(room.db_id)
+    if room is None or room.room_state != RoomState.STARTED:
+        return None
+    black_won = room.is_black_win()
+    if black_won is None:
+        return None
+    if not room.settled:
+        # marking the very room the winners were taken from lets exactly one caller count the game
+        claimed = await storage.rooms.compare_and_set(room.db_id, room.version, {"settled": True})
+        if claimed is None:
+            return None
+        await storage.users.settle(claimed, black_won)
+    # a room that is settled but not ended, e.g. after a failure, is ended without counting it again
+    ended_room = await storage.rooms.end_game(room.db_id)
+    if ended_room is None:
+        return None
+    return write_through(ended_room)
+
+
+async def claim_phase(room: RoomModel, phase: GamePhase) -> RoomModel | None:
+    """
+    Move a started game to `phase` and return the updated room.
+
+    Every player of the room calls this when entering the phase, but only one of them wins and gets the room,
+    the rest get None. The winner is the one to run the phase for the whole room, e.g. to start its timer.
+    """
+    rooms = get_storage().rooms
+    for _ in range(config.cas_retries):
+        if room.phase == phase:
+            return None
+        updated = await rooms.compare_and_set(room.db_id, room.version, {"phase": phase.value})
+        if updated is not None:
+            event_log.append(updated.room_id, EventKind.PHASE, text=phase.value)
+            return write_through(updated)
+        cas_conflicts["claim_phase"] += 1
+        room = await rooms.find_by_db_id(room.db_id)
+        if room is None:
+            msg = "Something's wrong. Room not found"
+            raise RuntimeError(msg)
+        room_cache.put(room)
+    msg = f"Room {room.room_id} is changed too often, could not move it to {phase.value} phase"
+    raise RuntimeError(msg)
+
+
+async def find_recoverable_rooms() -> list[RoomModel]:
+    """
+    Return started games worth recovering after a restart, the most recently active first:
+    the ones waiting for a phase timer or active within ``db.recovery_window``.
+    """
+    active_since = datetime.now(timezone.utc) - timedelta(seconds=config.recovery_window)
+    return await get_storage().rooms.find_recoverable(active_since)
+
+
+async def find_users(tg_ids: list[int]) -> list[UserModel]:
+    return await get_storage().users.find_by_tg_ids(tg_ids)
+
+
+async def set_deadline(room_db_id: ObjectId, signal: str, deadline: float):
+    """Persist the timer of the current phase, see :py:attr:`RoomModel.deadline`."""
+    room = await get_storage().rooms.set_deadline(room_db_id, signal, deadline)
+    if room is None:
+        msg = "Something's wrong. Room not found"
+        raise RuntimeError(msg)
+    write_through(room)
+
+
+async def clear_deadline(room_db_id: ObjectId, deadline: float):
+    room = await get_storage().rooms.clear_deadline(room_db_id, deadline)
+    if room is not None:
+        write_through(room)
+
+
+async def update_last_words(room_id: str, msg: str):
+    room = await get_storage().rooms.update_last_words(room_id, msg)
+    if room is not None:
+        write_through(room)
+        event_log.append(room_id, EventKind.LAST_WORDS, text=msg)
+
+
+async def _raise_not_found(room_db_id: ObjectId, msg: str):
+    """Explain why a conditional update matched nothing. Only called on the failure path."""
+    if not await get_storage().rooms.exists(room_db_id):
+        room_msg = "Something's wrong. Room not found"
+        raise RuntimeError(room_msg)
+    raise ValueError(msg)
@@ -0,0 +1,113 @@
+"""
+Process-wide cache of game rooms.
+
+Every write routine stores the room it has just written (write-through), so readers of the
+same process never see stale data. Writes made by other processes are noticed through
+a change stream (see :py:func:`ai_mafia.db.async_routines.watch_room_changes`).
+Change streams need a replica set, so without one entries simply expire after a short TTL.
+"""
+
+import time
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+
+from ai_mafia.config import load_config
+
+from .matchmaking import matchmaker
+from .models import RoomModel
+from .readiness import readiness
+from .snapshot import invalidate_room
+
+
+class RoomCache:
+    """
+    Bounded LRU cache of rooms keyed by ``room_id``.
+
+    Cached rooms are shared between all callers and must not be mutated.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        """Lifetime of an entry in seconds. Ignored while a change stream keeps the cache up-to-date."""
+
+        self.watching = False
+        """Whether a change stream currently invalidates entries written by other processes."""
+
+        self.hits = 0
+        self.misses = 0
+
+        self._rooms: OrderedDict[str, tuple[float, RoomModel]] = OrderedDict()
+        self._room_ids: dict[str, str] = {}
+        """Map ``str(db_id)`` to ``room_id``, since some writes only know the former."""
+
+    def get(self, room_id: str) -> RoomModel | None:
+        entry = self._rooms.get(room_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, room = entry
+        if not self.watching and time.monotonic() - stored_at > self.ttl:
+            self._evict(room_id)
+            self.misses += 1
+            return None
+        self._rooms.move_to_end(room_id)
+        self.hits += 1
+        return room
+
+    def put(self, room: RoomModel):
+        self._rooms[room.room_id] = (time.monotonic(), room)
+        self._rooms.move_to_end(room.room_id)
+        self._room_ids[str(room.db_id)] = room.room_id
+        while len(self._rooms) > self.max_size:
+            self._evict(next(iter(self._rooms)))
+
+    def contains(self, room_db_id: ObjectId) -> bool:
+        return str(room_db_id) in self._room_ids
+
+    def version(self, room_db_id: ObjectId) -> int | None:
+        """Version of the cached room, regardless of its age, or None if it is not cached."""
+        room_id = self._room_ids.get(str(room_db_id))
+        if room_id is None:
+            return None
+        _, room = self._rooms[room_id]
+        return room.version
+
+    def invalidate(self, room_db_id: ObjectId):
+        room_id = self._room_ids.get(str(room_db_id))
+        if room_id is not None:
+            self._evict(room_id)
+
+    def clear(self):
+        self._rooms.clear()
+        self._room_ids.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._rooms),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "watching": self.watching,
+        }
+
+    def _evict(self, room_id: str):
+        _, room = self._rooms.pop(room_id)
+        self._room_ids.pop(str(room.db_id), None)
+
+
+config = load_config().db
+
+room_cache = RoomCache(max_size=config.cache_size, ttl=config.cache_ttl)
+
+
+def write_through(room: RoomModel) -> RoomModel:
+    """Register a room that has just been written to database. Called by every write routine."""
+    invalidate_room(room.db_id)
+    room_cache.put(room)
+    matchmaker.update(room)
+    readiness.update(room)
+    return room
@@ -0,0 +1,60 @@
+"""
+Lazily created MongoDB clients shared by the whole process.
+
+Nothing connects to the database on import. A client is created on first use and then reused,
+so all routines share one connection pool. pymongo clients must not be shared across ``fork()``,
+so a forked worker (e.g. one of several uvicorn workers) gets its own clients.
+"""
+
+import os
+
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.database import Database
+
+from ai_mafia.config import DBConfig, load_config
+
+config = load_config().db
+
+_clients: dict[type, MongoClient | AsyncMongoClient] = {}
+_pid: int | None = None
+
+
+def client_options(config: DBConfig) -> dict:
+    """Keyword arguments for :py:class:`MongoClient` and :py:class:`AsyncMongoClient`."""
+    return {
+        "host": config.host,
+        "port": config.port,
+        "maxPoolSize": config.max_pool_size,
+        "minPoolSize": config.min_pool_size,
+        "serverSelectionTimeoutMS": config.server_selection_timeout_ms,
+        "w": config.write_concern,
+        "readPreference": config.read_preference,
+    }
+
+
+def _get_client(client_cls: type[MongoClient | AsyncMongoClient]):
+    global _pid  # noqa: PLW0603
+    if _pid != os.getpid():
+        # clients inherited from the parent process are unusable, drop them without closing
+        _clients.clear()
+        _pid = os.getpid()
+    if client_cls not in _clients:
+        _clients[client_cls] = client_cls(**client_options(config))
+    return _clients[client_cls]
+
+
+def get_client() -> MongoClient:
+    return _get_client(MongoClient)
+
+
+def get_async_client() -> AsyncMongoClient:
+    return _get_client(AsyncMongoClient)
+
+
+def get_database() -> Database:
+    return get_client().get_database(config.name)
+
+
+def get_async_database() -> AsyncDatabase:
+    return get_async_client().get_database(config.name)
@@ -0,0 +1,87 @@
+"""
+Append-only log of game events.
+
+Every shot, check, death and phase change is recorded as a small document in the ``events`` collection,
+which is the history of a game and the audit trail for disputes. Events are buffered in memory and written
+in batches by :py:meth:`EventLog.run`, so a click costs no extra database round-trip.
+
+Sequence numbers of events are reserved from a counter in the database for a whole batch, one round-trip per room,
+so they stay unique and ordered across restarts and several processes.
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections import Counter
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from ai_mafia.config import load_config
+from ai_mafia.types import EventKind
+
+from .models import EventModel
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: list[EventModel] = []
+        self._full = asyncio.Event()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def append(self, room_id: str, kind: EventKind, **fields) -> EventModel:
+        """Buffer an event. `fields` are the optional fields of :py:class:`EventModel`."""
+        event = EventModel(room_id=room_id, kind=kind, **fields)
+        self._buffer.append(event)
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+        return event
+
+    async def flush(self):
+        """Write all buffered events. On failure they are kept for the next flush."""
+        self._full.clear()
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await self._number(batch)
+            await get_storage().events.insert_many(batch)
+        except BulkWriteError as exc:
+            # the rest of the batch is stored, and errors of single documents are not going away on retry;
+            # duplicate keys are events of a retried batch that had been stored before the failure
+            logger.warning("Failed to write %d game events: %s", len(exc.details["writeErrors"]), exc.details)
+        except PyMongoError:
+            logger.warning("Failed to write %d game events, will retry", len(batch), exc_info=True)
+            self._buffer[:0] = batch
+
+    @staticmethod
+    async def _number(batch: list[EventModel]):
+        """Assign sequence numbers in buffer order. Events of a retried batch keep the numbers they have got."""
+        unnumbered = [event for event in batch if event.seq is None]
+        counts = Counter(event.room_id for event in unnumbered)
+        events = get_storage().events
+        next_seqs = {room_id: await events.reserve_seqs(room_id, count) for room_id, count in counts.items()}
+        for event in unnumbered:
+            event.seq = next_seqs[event.room_id]
+            next_seqs[event.room_id] += 1
+
+    async def run(self):
+        """Flush the buffer when it is full or every `flush_interval` seconds. Runs until cancelled."""
+        try:
+            while True:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+config = load_config().db
+
+event_log = EventLog(batch_size=config.event_batch_size, flush_interval=config.event_flush_interval)
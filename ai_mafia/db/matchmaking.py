@@ -0,0 +1,117 @@
+"""
+In-memory matchmaking over open rooms.
+
+Rooms are kept in a heap ordered by the number of taken seats, so that the fullest room with
+a free seat is found in O(log n) without a database query. The matchmaker follows every write
+routine (see :py:func:`ai_mafia.db.cache.write_through`) and is rebuilt from database on startup
+(see :py:func:`ai_mafia.db.async_routines.rebuild_matchmaker`).
+"""
+
+import heapq
+import itertools
+
+from bson.objectid import ObjectId
+from pydantic import BaseModel
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.types import RoomState
+
+from .models import RoomModel
+
+
+class OpenRoom(BaseModel):
+    room_db_id: str
+
+    room_id: str
+
+    players: set[str] = set()
+    """Users stored in the room in database"""
+
+    pending: set[str] = set()
+    """Users that have reserved a seat, but are not stored in database yet"""
+
+    @property
+    def n_taken(self) -> int:
+        return len(self.players | self.pending)
+
+
+class Matchmaker:
+    """
+    Open rooms ordered by the number of taken seats.
+
+    None of the methods awaits anything, so within one event loop every reservation is atomic.
+    """
+
+    def __init__(self, n_seats: int):
+        self.n_seats = n_seats
+        self._rooms: dict[str, OpenRoom] = {}
+        self._heap: list[tuple[int, int, str]] = []
+        """Entries ``(-n_taken, tie_breaker, str(db_id))``. Outdated entries are dropped lazily."""
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __contains__(self, room_db_id: ObjectId):
+        return str(room_db_id) in self._rooms
+
+    def update(self, room: RoomModel):
+        """Synchronize with the room as it is stored in database."""
+        key = str(room.db_id)
+        if room.room_state != RoomState.CREATED:
+            self._rooms.pop(key, None)
+            return
+        open_room = self._rooms.setdefault(key, OpenRoom(room_db_id=key, room_id=room.room_id))
+        open_room.players = {player.user_id for player in room.list_players}
+        open_room.pending -= open_room.players
+        self._push(key)
+
+    def remove(self, room_db_id: ObjectId | str):
+        self._rooms.pop(str(room_db_id), None)
+
+    def clear(self):
+        self._rooms.clear()
+        self._heap.clear()
+
+    def pick(self) -> OpenRoom | None:
+        """Return the fullest room with a free seat."""
+        while self._heap:
+            neg_taken, _, key = self._heap[0]
+            open_room = self._rooms.get(key)
+            if open_room is not None and open_room.n_taken == -neg_taken and open_room.n_taken < self.n_seats:
+                return open_room
+            heapq.heappop(self._heap)
+        return None
+
+    def reserve(self, room_db_id: ObjectId, user_id: str) -> bool:
+        """
+        Take a seat for the user. Return False if the room is full.
+        Rooms unknown to the matchmaker are left for the database to decide.
+        """
+        key = str(room_db_id)
+        open_room = self._rooms.get(key)
+        if open_room is None or user_id in open_room.players or user_id in open_room.pending:
+            return True
+        if open_room.n_taken >= self.n_seats:
+            return False
+        open_room.pending.add(user_id)
+        self._push(key)
+        return True
+
+    def release(self, room_db_id: ObjectId, user_id: str):
+        """Give back a seat reserved with :py:meth:`reserve` that has not been stored in database."""
+        key = str(room_db_id)
+        open_room = self._rooms.get(key)
+        if open_room is not None and user_id in open_room.pending:
+            open_room.pending.discard(user_id)
+            self._push(key)
+
+    def _push(self, key: str):
+        heapq.heappush(self._heap, (-self._rooms[key].n_taken, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._rooms) + 64:
+            # too many outdated entries, rebuild the heap from scratch
+            self._heap = [(-room.n_taken, next(self._counter), k) for k, room in self._rooms.items()]
+            heapq.heapify(self._heap)
+
+
+matchmaker = Matchmaker(n_seats=MAX_PLAYERS)
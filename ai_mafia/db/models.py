@@ -1,7 +1,9 @@
+from datetime import datetime, timezone
+
 from bson.objectid import ObjectId
 from pydantic import BaseModel, ConfigDict, Field
 
-from ai_mafia.types import PlayerRole, PlayerState, RoomState
+from ai_mafia.types import EventKind, GamePhase, PlayerRole, PlayerState, RoomState
 
 
 class UserModel(BaseModel):
@@ -57,6 +59,24 @@ class RoomModel(BaseModel):
 
     room_state: RoomState = RoomState.CREATED
 
+    phase: GamePhase | None = None
+    """Phase of a started game. Moved forward by exactly one player, see :py:func:`async_routines.claim_phase`."""
+
+    deadline: float | None = None
+    """Unix time when `pending_signal` is due. Persisted, so that phase timers survive a restart."""
+
+    pending_signal: str | None = None
+    """Message sent to every player at `deadline` to move them to the next node of the script."""
+
+    settled: bool = False
+    """Whether the game is counted in the counters of its players, see :py:func:`async_routines.settle_game`."""
+
+    last_activity_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    """Time of the last write to the room. Idle open rooms are expired by it, see :py:func:`setup.ensure_indexes`."""
+
+    version: int = 0
+    """Incremented by every write to the room, so that compare-and-set writes can detect concurrent changes."""
+
     list_players: list[PlayerModel] = []
     """List of user's tg id in the game room"""
 
@@ -99,8 +119,42 @@ class RoomModel(BaseModel):
             player.shoot_cnt = 0
         return flag
 
+    def is_black_win(self) -> bool | None:
+        """
+        Return True if mafia has won, False if the red team has won and None if the game is not over yet.
+        """
+        alive_players = [player for player in self.list_players if player.state == PlayerState.ALIVE]
+        cnt_black = sum(player.role.is_black() for player in alive_players)
+        if cnt_black == 0:
+            return False
+        if len(alive_players) - cnt_black <= cnt_black:
+            return True
+        return None
+
     def get_pre_dead_player(self) -> PlayerModel | None:
         for player in self.list_players:
             if player.state == PlayerState.PRE_DEAD:
                 return player
         return None
+
+
+class EventModel(BaseModel):
+    """Entry of the append-only log of game events, see :py:mod:`ai_mafia.db.events`."""
+
+    room_id: str
+
+    seq: int | None = None
+    """Order of the event within the room, assigned when the event is written"""
+
+    kind: EventKind
+
+    actor: int | None = None
+    """Number of the player who made the move"""
+
+    target: int | None = None
+    """Number of the player the move was made on"""
+
+    text: str | None = None
+    """Phase name, last words or other payload of the event"""
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
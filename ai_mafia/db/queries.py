@@ -0,0 +1,217 @@
+"""
+Filters, update documents and pipelines for room queries.
+
+They are shared by the blocking routines in :py:mod:`ai_mafia.db.routines`
+and their asyncio counterparts in :py:mod:`ai_mafia.db.async_routines`.
+"""
+
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import UpdateMany
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.types import PlayerRole, PlayerState, RoomState
+
+from .models import EventModel, RoomModel
+
+RANDOM_ROOM_CANDIDATES = 5
+"""Number of open rooms sampled by :py:func:`random_room_pipeline`, the fullest of them wins."""
+
+TOUCH_ROOM = {"$inc": {"version": 1}, "$currentDate": {"last_activity_at": True}}
+"""Part of every update document, see :py:attr:`RoomModel.version` and :py:attr:`RoomModel.last_activity_at`."""
+
+TOUCH_ROOM_PIPELINE = {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}, "last_activity_at": "$$NOW"}
+"""Same as :py:data:`TOUCH_ROOM` for the ``$set`` stage of pipeline updates."""
+
+
+def random_room_pipeline() -> list[dict]:
+    """
+    Sample a few open rooms on the server side and return the one closest to being full,
+    so that players gather in the same rooms and games start sooner.
+    """
+    return [
+        # rooms with a free seat are the ones where the last seat is not taken
+        {"$match": {"room_state": RoomState.CREATED.value, f"list_players.{MAX_PLAYERS - 1}": {"$exists": False}}},
+        {"$sample": {"size": RANDOM_ROOM_CANDIDATES}},
+        {"$addFields": {"n_players": {"$size": "$list_players"}}},
+        {"$sort": {"n_players": -1}},
+        {"$limit": 1},
+        {"$project": {"n_players": False}},
+    ]
+
+
+def room_document(room: RoomModel) -> dict:
+    """Document of a new room. Dates are kept as BSON dates, which the TTL index needs."""
+    return {**room.model_dump(mode="json"), "last_activity_at": room.last_activity_at}
+
+
+def event_document(event: EventModel) -> dict:
+    """Document of a game event. Dates are kept as BSON dates, same as in :py:func:`room_document`."""
+    return {**event.model_dump(mode="json"), "created_at": event.created_at}
+
+
+def set_player_state_query(user_db_id: ObjectId, room_db_id: ObjectId, state: PlayerState) -> tuple[dict, dict]:
+    return (
+        {"_id": room_db_id, "list_players.user_id": str(user_db_id)},
+        {"$set": {"list_players.$.state": state.value}, **TOUCH_ROOM},
+    )
+
+
+def join_room_query(player: dict, room_db_id: ObjectId) -> tuple[dict, dict]:
+    """
+    Seat the player if the room is not started, has a free seat and does not have this player yet.
+    `player` is a json-dumped :py:class:`PlayerModel`.
+    """
+    return (
+        {
+            "_id": room_db_id,
+            "room_state": RoomState.CREATED.value,
+            "list_players.user_id": {"$ne": player["user_id"]},
+            f"list_players.{MAX_PLAYERS - 1}": {"$exists": False},
+        },
+        {"$push": {"list_players": player}, **TOUCH_ROOM},
+    )
+
+
+def exit_room_query(user_db_id: ObjectId, room_db_id: ObjectId) -> tuple[dict, dict]:
+    exit_id = str(user_db_id)
+    return (
+        {"_id": room_db_id, "list_players.user_id": exit_id},
+        {"$pull": {"list_players": {"user_id": exit_id}}, **TOUCH_ROOM},
+    )
+
+
+def start_game_query(room_db_id: ObjectId, roles: list[PlayerRole]) -> tuple[dict, list]:
+    """Deal `roles` and numbers to the players in their joining order. Matches only rooms that are not started yet."""
+    deal_players = {
+        "$map": {
+            "input": {"$range": [0, {"$size": "$list_players"}]},
+            "as": "i",
+            "in": {
+                "$mergeObjects": [
+                    {"$arrayElemAt": ["$list_players", "$$i"]},
+                    {
+                        "state": PlayerState.ALIVE.value,
+                        "role": {"$arrayElemAt": [[role.value for role in roles], "$$i"]},
+                        "number": {"$add": ["$$i", 1]},
+                    },
+                ]
+            },
+        }
+    }
+    return (
+        {"_id": room_db_id, "room_state": RoomState.CREATED.value},
+        [{"$set": {"list_players": deal_players, "room_state": RoomState.STARTED.value, **TOUCH_ROOM_PIPELINE}}],
+    )
+
+
+def shoot_query(room_db_id: ObjectId, player_number: int) -> tuple[dict, dict]:
+    return (
+        {"_id": room_db_id, "list_players.number": player_number},
+        {"$inc": {"list_players.$.shoot_cnt": 1, "version": 1}, "$currentDate": TOUCH_ROOM["$currentDate"]},
+    )
+
+
+def murder_query(room_id: str) -> tuple[dict, list]:
+    """Server-side version of :py:meth:`RoomModel.kill`."""
+    black_roles = [role.value for role in PlayerRole if role.is_black()]
+    cnt_black = {
+        "$size": {
+            "$filter": {
+                "input": "$list_players",
+                "as": "p",
+                "cond": {"$and": [{"$eq": ["$$p.state", PlayerState.ALIVE.value]}, {"$in": ["$$p.role", black_roles]}]},
+            }
+        }
+    }
+    kill_players = {
+        "$let": {
+            "vars": {"cnt_black": cnt_black},
+            "in": {
+                "$map": {
+                    "input": "$list_players",
+                    "as": "p",
+                    "in": {
+                        "$mergeObjects": [
+                            "$$p",
+                            {
+                                "state": {
+                                    "$cond": [
+                                        {"$eq": ["$$p.shoot_cnt", "$$cnt_black"]},
+                                        PlayerState.PRE_DEAD.value,
+                                        "$$p.state",
+                                    ]
+                                },
+                                "shoot_cnt": 0,
+                            },
+                        ]
+                    },
+                }
+            },
+        }
+    }
+    return {"room_id": room_id}, [{"$set": {"list_players": kill_players, **TOUCH_ROOM_PIPELINE}}]
+
+
+def end_game_query(room_db_id: ObjectId) -> tuple[dict, dict]:
+    """Matches only started rooms, so that a game is ended once."""
+    return (
+        {"_id": room_db_id, "room_state": RoomState.STARTED.value},
+        {"$set": {"room_state": RoomState.ENDED.value}, **TOUCH_ROOM},
+    )
+
+
+def last_words_query(room_id: str, msg: str) -> tuple[dict, dict]:
+    return {"room_id": room_id}, {"$set": {"last_words": msg}, **TOUCH_ROOM}
+
+
+def set_deadline_query(room_db_id: ObjectId, signal: str, deadline: float) -> tuple[dict, dict]:
+    return {"_id": room_db_id}, {"$set": {"pending_signal": signal, "deadline": deadline}, **TOUCH_ROOM}
+
+
+def clear_deadline_query(room_db_id: ObjectId, deadline: float) -> tuple[dict, dict]:
+    """Matches only if no newer deadline has been set since."""
+    return (
+        {"_id": room_db_id, "deadline": deadline},
+        {"$set": {"pending_signal": None, "deadline": None}, **TOUCH_ROOM},
+    )
+
+
+def compare_and_set_query(room_db_id: ObjectId, version: int, fields: dict) -> tuple[dict, dict]:
+    """Set `fields` only if nobody has written to the room since it had `version`."""
+    # rooms created before versioning have no version field
+    version_filter = version if version > 0 else {"$in": [0, None]}
+    return {"_id": room_db_id, "version": version_filter}, {"$set": fields, **TOUCH_ROOM}
+
+
+def settle_game_requests(room: RoomModel, black_won: bool) -> list[UpdateMany]:
+    """Bulk write requests that count the game for every participant and the win for the winners."""
+    winners = [ObjectId(player.user_id) for player in room.list_players if player.role.is_black() == black_won]
+    losers = [ObjectId(player.user_id) for player in room.list_players if player.role.is_black() != black_won]
+    return [
+        UpdateMany({"_id": {"$in": winners}}, {"$inc": {"game_counter": 1, "win_counter": 1}}),
+        UpdateMany({"_id": {"$in": losers}}, {"$inc": {"game_counter": 1}}),
+    ]
+
+
+def recoverable_rooms_filter(active_since: datetime) -> dict:
+    """Started games with a pending phase timer or with activity since `active_since`."""
+    started = RoomState.STARTED.value
+    # every branch names the state, so that it can use its own partial index
+    return {
+        "$or": [
+            {"room_state": started, "deadline": {"$ne": None}},
+            {"room_state": started, "last_activity_at": {"$gte": active_since}},
+        ]
+    }
+
+
+def idle_rooms_filter(cutoff: datetime) -> dict:
+    """Open rooms nobody has touched since `cutoff`."""
+    return {"room_state": RoomState.CREATED.value, "last_activity_at": {"$lt": cutoff}}
+
+
+def ended_rooms_filter(cutoff: datetime) -> dict:
+    """Finished games nobody has touched since `cutoff`."""
+    return {"room_state": RoomState.ENDED.value, "last_activity_at": {"$lt": cutoff}}
@@ -0,0 +1,56 @@
+"""
+Readiness of rooms delivered as events instead of polling.
+
+Every room written by this process (see :py:func:`ai_mafia.db.cache.write_through`) and every room changed
+by another process (see :py:func:`ai_mafia.db.async_routines.watch_room_changes`) is passed to
+:py:meth:`ReadinessBoard.update`, so a waiting room costs nothing until all its players are ready.
+"""
+
+import asyncio
+
+from bson.objectid import ObjectId
+
+from ai_mafia.constants import N_PLAYERS
+from ai_mafia.types import RoomState
+
+from .models import RoomModel
+
+
+class ReadinessBoard:
+    """
+    Future per waited room. It is resolved with the room once all players of the room are ready,
+    or once there is nobody to wait for: the room is empty or its game has already started.
+    """
+
+    def __init__(self, n_players: int):
+        self.n_players = n_players
+        self._futures: dict[str, asyncio.Future[RoomModel]] = {}
+
+    def __len__(self):
+        return len(self._futures)
+
+    def __contains__(self, room_db_id: ObjectId):
+        return str(room_db_id) in self._futures
+
+    def watch(self, room_db_id: ObjectId) -> asyncio.Future[RoomModel]:
+        """Start waiting for the room. Call it before reading the room, so that no write is missed."""
+        key = str(room_db_id)
+        if key not in self._futures:
+            self._futures[key] = asyncio.get_running_loop().create_future()
+        return self._futures[key]
+
+    def update(self, room: RoomModel):
+        future = self._futures.get(str(room.db_id))
+        if future is None or future.done():
+            return
+        if room.is_room_ready(self.n_players) or room.room_state != RoomState.CREATED or len(room.list_players) == 0:
+            future.set_result(room)
+
+    def discard(self, room_db_id: ObjectId):
+        """Stop waiting for the room, e.g. because it has been deleted. Pending waiters are cancelled."""
+        future = self._futures.pop(str(room_db_id), None)
+        if future is not None:
+            future.cancel()
+
+
+readiness = ReadinessBoard(n_players=N_PLAYERS)
@@ -2,24 +2,38 @@ import random
 from uuid import uuid4
 
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
 
+from ai_mafia.constants import N_PLAYERS
 from ai_mafia.types import PlayerRole, PlayerState, RoomState
 
+from .cache import room_cache, write_through
+from .client import get_database
+from .matchmaking import matchmaker
 from .models import PlayerModel, RoomModel, UserModel
-from .setup import load_config
+from .queries import (
+    compare_and_set_query,
+    end_game_query,
+    exit_room_query,
+    join_room_query,
+    last_words_query,
+    murder_query,
+    random_room_pipeline,
+    room_document,
+    set_player_state_query,
+    settle_game_requests,
+    shoot_query,
+    start_game_query,
+)
 
-config = load_config().db
 
-# Connect to the MongoDB server
-client = MongoClient(host=config.host, port=config.port)
+def users_collection() -> Collection:
+    return get_database().get_collection("users")
 
-# Select the database
-db = client.get_database(config.name)
 
-# Select the collections
-users_collection = db.get_collection("users")
-rooms_collection = db.get_collection("game_rooms")
+def rooms_collection() -> Collection:
+    return get_database().get_collection("game_rooms")
 
 
 def find_user(tg_id: int) -> UserModel | None:
@@ -27,7 +41,7 @@ def find_user(tg_id: int) -> UserModel | None:
     If info about this tg user is stored in our database,
     return it. Otherwise, return None.
     """
-    result = users_collection.find_one({"tg_id": tg_id})
+    result = users_collection().find_one({"tg_id": tg_id})
     if result is None:
         return None
     return UserModel(**result)
@@ -36,25 +50,30 @@ def find_user(tg_id: int) -> UserModel | None:
 def add_user(tg_id: int, tg_nickname: str) -> UserModel:
     """Add info about user to database and return full info about him."""
     user = UserModel(tg_id=tg_id, tg_nickname=tg_nickname)
-    result = users_collection.insert_one(user.model_dump())
+    result = users_collection().insert_one(user.model_dump())
     user.db_id = result.inserted_id
     return user
 
 
 def get_tg_username(db_id: ObjectId) -> str:
-    result = users_collection.find_one({"_id": db_id})
+    result = users_collection().find_one({"_id": db_id}, projection={"_id": False, "tg_nickname": True})
     return result["tg_nickname"]
 
 
 def increment_counter(db_id: ObjectId) -> int:
     """Increment win counter for a given user by 1 and return resulting value."""
-    users_collection.update_one({"_id": db_id}, {"$inc": {"win_counter": 1}})
-    return get_counter(db_id)
+    result = users_collection().find_one_and_update(
+        {"_id": db_id},
+        {"$inc": {"win_counter": 1}},
+        projection={"_id": False, "win_counter": True},
+        return_document=ReturnDocument.AFTER,
+    )
+    return result["win_counter"]
 
 
 def get_counter(db_id: ObjectId) -> int:
     """Find and return win counter for a given user."""
-    result = users_collection.find_one({"_id": db_id})
+    result = users_collection().find_one({"_id": db_id}, projection={"_id": False, "win_counter": True})
     return result["win_counter"]
 
 
@@ -63,128 +82,197 @@ def find_game_room(room_id: str) -> RoomModel | None:
     If info about this game room is stored in our database,
     return it. Otherwise, return None.
     """
-    result = rooms_collection.find_one({"room_id": room_id})
+    room = room_cache.get(room_id)
+    if room is not None:
+        return room
+    result = rooms_collection().find_one({"room_id": room_id})
     if result is None:
         return None
-    return RoomModel(**result)
+    room = RoomModel(**result)
+    room_cache.put(room)
+    return room
 
 
 def add_room(name_room: str) -> RoomModel:
     """Add new game room and store info in database, return created room"""
     room = RoomModel(name=name_room, room_id=str(uuid4().hex))
-    result = rooms_collection.insert_one(room.model_dump(mode="json"))
+    result = rooms_collection().insert_one(room_document(room))
     room.db_id = result.inserted_id
-    return room
+    return write_through(room)
 
 
 def get_random_room() -> RoomModel | None:
     """
-    If any game room open, randomly return one of them.
+    If any game room open, randomly return one of them, preferring the fuller ones.
     Otherwise, return None.
     """
-    list_room = list(rooms_collection.find({"room_state": RoomState.CREATED.value}))
-    if len(list_room) == 0:
+    room = next(rooms_collection().aggregate(random_room_pipeline()), None)
+    if room is None:
         return None
-    room = random.choice(list_room)
-    return RoomModel(**room)
+    room = RoomModel(**room)
+    room_cache.put(room)
+    return room
+
+
+def find_open_room() -> RoomModel | None:
+    """
+    Same as :py:func:`get_random_room`, but the room is picked by the in-memory matchmaker.
+    Database is queried only if the matchmaker knows no open room.
+    """
+    while (open_room := matchmaker.pick()) is not None:
+        room = find_game_room(open_room.room_id)
+        if room is not None and room.room_state == RoomState.CREATED:
+            return room
+        # the room has been started or deleted by another process
+        matchmaker.remove(open_room.room_db_id)
+    return get_random_room()
 
 
 def set_player_state(user_db_id: ObjectId, room_db_id: ObjectId, state: PlayerState) -> RoomModel:
     """Mark user as ready and return updated room model"""
-    room = rooms_collection.find_one({"_id": room_db_id})
+    query, update = set_player_state_query(user_db_id, room_db_id, state)
+    room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
     if room is None:
-        msg = "Something's wrong. Room not found"
-        raise RuntimeError(msg)
-    room_model = RoomModel(**room)
-    room_model.change_player_state(user_db_id=str(user_db_id), state=state)
-    list_players_dict = [player.model_dump(mode="json") for player in room_model.list_players]
-    rooms_collection.update_one({"_id": room_db_id}, {"$set": {"list_players": list_players_dict}})
-    return room_model
+        _raise_not_found(room_db_id, "Something's wrong. Player not found")
+    return write_through(RoomModel(**room))
 
 
 def show_rooms():
-    for doc in rooms_collection.find():
+    for doc in rooms_collection().find():
         print(doc)
 
 
 def is_room_ready(room_db_id: ObjectId):
     """
-    Check whether there are 10 ready players in the room
+    Check whether all players of the room are ready
     """
-    # TODO async find_one
-    room = rooms_collection.find_one({"_id": room_db_id})
+    room = rooms_collection().find_one({"_id": room_db_id})
     if room is None:
         msg = "Something's wrong. Room not found"
         raise RuntimeError(msg)
     room_model = RoomModel(**room)
-    return room_model.is_room_ready()
+    return room_model.is_room_ready(N_PLAYERS)
 
 
-def join_room(user_db_id: ObjectId, room_db_id: ObjectId, ctx_id: str, chat_id: int):
-    room = rooms_collection.find_one({"_id": room_db_id})
+def join_room(user_db_id: ObjectId, room_db_id: ObjectId, ctx_id: str, chat_id: int) -> RoomModel | None:
+    """
+    Add user to the room and return updated room model.
+    Return None if the room is full or the game has already started.
+    Joining the same room twice does not add the user again.
+    """
+    player = PlayerModel(user_id=str(user_db_id), ctx_id=ctx_id, chat_id=chat_id).model_dump(mode="json")
+    if not matchmaker.reserve(room_db_id, player["user_id"]):
+        return None
+    query, update = join_room_query(player, room_db_id)
+    try:
+        room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    except BaseException:
+        # if the write went through after all, the seat comes back with the next update of the room
+        matchmaker.release(room_db_id, player["user_id"])
+        raise
+    if room is not None:
+        return write_through(RoomModel(**room))
+
+    # the join was rejected, find out why
+    matchmaker.release(room_db_id, player["user_id"])
+    room = rooms_collection().find_one({"_id": room_db_id})
     if room is None:
         msg = "Something's wrong. Room not found"
         raise RuntimeError(msg)
-    lst_players: list = room["list_players"]
-    lst_players.append(PlayerModel(user_id=str(user_db_id), ctx_id=ctx_id, chat_id=chat_id).model_dump(mode="json"))
-    rooms_collection.update_one({"_id": room_db_id}, {"$set": {"list_players": lst_players}})
+    room = RoomModel(**room)
+    room_cache.put(room)
+    matchmaker.update(room)
+    if room.get_player(player["user_id"]) is not None:
+        return room
+    return None
 
 
 def exit_room(user_db_id: ObjectId, room_db_id: ObjectId):
-    room = rooms_collection.find_one({"_id": room_db_id})
+    query, update = exit_room_query(user_db_id, room_db_id)
+    room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
     if room is None:
-        msg = "Something's wrong. Room not found"
-        raise RuntimeError(msg)
-    exit_id = str(user_db_id)
-    lst_players: list = room["list_players"]
-    for i in range(len(lst_players)):
-        if lst_players[i]["user_id"] == exit_id:
-            lst_players.pop(i)
-            break
-    else:
-        msg = "Something's wrong. User not found in the room"
-        raise ValueError(msg)
-    rooms_collection.update_one({"_id": room_db_id}, {"$set": {"list_players": lst_players}})
-
+        _raise_not_found(room_db_id, "Something's wrong. User not found in the room")
+    write_through(RoomModel(**room))
 
-def start_game(room_db_id: ObjectId):
-    room = RoomModel(**rooms_collection.find_one({"_id": room_db_id}))
 
+def start_game(room_db_id: ObjectId) -> bool:
+    """
+    Deal shuffled roles and numbers to the players and mark the room as started.
+    Return False if the game has already been started by someone else.
+    """
     roles = PlayerRole.all_roles()
     random.shuffle(roles)
-
-    for i, player in enumerate(room.list_players):
-        player.state = PlayerState.ALIVE
-        player.role = roles[i]
-        player.number = i + 1
-
-    dumped_players_list = room.model_dump(mode="json")["list_players"]
-
-    rooms_collection.update_one(
-        {"_id": room_db_id}, {"$set": {"list_players": dumped_players_list, "room_state": RoomState.STARTED.value}}
-    )
+    query, update = start_game_query(room_db_id, roles)
+    room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if room is None:
+        return False
+    write_through(RoomModel(**room))
+    return True
 
 
 def shoot(room_db_id: ObjectId, player_number: int):
-    room = RoomModel(**rooms_collection.find_one({"_id": room_db_id}))
-
-    for player in room.list_players:
-        if player.number == player_number:
-            player.shoot_cnt += 1
-            break
-
-    dumped_players_list = room.model_dump(mode="json")["list_players"]
-
-    rooms_collection.update_one({"_id": room_db_id}, {"$set": {"list_players": dumped_players_list}})
+    query, update = shoot_query(room_db_id, player_number)
+    room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if room is not None:
+        write_through(RoomModel(**room))
 
 
 def murder(room_id: str) -> bool:
-    room = find_game_room(room_id)
-    res = room.kill()
-    list_players_dict = [player.model_dump(mode="json") for player in room.list_players]
-    rooms_collection.update_one({"room_id": room_id}, {"$set": {"list_players": list_players_dict}})
+    """
+    Mark the player shot by every alive black player as pre-dead and reset all shoot counters.
+    Return True if somebody was killed.
+    """
+    query, update = murder_query(room_id)
+    room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.BEFORE)
+    if room is None:
+        msg = "Something's wrong. Room not found"
+        raise RuntimeError(msg)
+    # replay the same transition on the state we have overwritten
+    # to find out whether somebody was killed and to get the updated room
+    room_model = RoomModel(**room)
+    res = room_model.kill()
+    room_model.version += 1
+    write_through(room_model)
     return res
 
 
+def settle_game(room: RoomModel) -> RoomModel | None:
+    """
+    Update win and game counters of all participants of a finished game and mark it as ended.
+    Return the ended room, or None if the game is not over yet or is ended by someone else.
+    """
+    # the winners are decided by the stored room, not by the copy of the caller, which may be behind
+    stored = rooms_collection().find_one({"_id": room.db_id, "room_state": RoomState.STARTED.value})
+    if stored is None:
+        return None
+    room = RoomModel(**stored)
+    black_won = room.is_black_win()
+    if black_won is None:
+        return None
+    if not room.settled:
+        # marking the very room the winners were taken from lets exactly one caller count the game
+        query, update = compare_and_set_query(room.db_id, room.version, {"settled": True})
+        if rooms_collection().find_one_and_update(query, update) is None:
+            return None
+        users_collection().bulk_write(settle_game_requests(room, black_won), ordered=False)
+    # a room that is settled but not ended, e.g. after a failure, is ended without counting it again
+    query, update = end_game_query(room.db_id)
+    ended_room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if ended_room is None:
+        return None
+    return write_through(RoomModel(**ended_room))
+
+
 def update_last_words(room_id: str, msg: str):
-    rooms_collection.update_one({"room_id": room_id}, {"$set": {"last_words": msg}})
+    query, update = last_words_query(room_id, msg)
+    room = rooms_collection().find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if room is not None:
+        write_through(RoomModel(**room))
+
+
+def _raise_not_found(room_db_id: ObjectId, msg: str):
+    """Explain why a conditional update matched nothing. Only called on the failure path."""
+    if rooms_collection().count_documents({"_id": room_db_id}, limit=1) == 0:
+        room_msg = "Something's wrong. Room not found"
+        raise RuntimeError(room_msg)
+    raise ValueError(msg)
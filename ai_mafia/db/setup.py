@@ -1,7 +1,13 @@
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.database import Database
+from pymongo.errors import OperationFailure
 
 from ai_mafia.config import load_config
+from ai_mafia.types import RoomState
+
+from .client import get_client
+
+config = load_config().db
 
 
 def create_database(client: MongoClient, db_name: str = "mafia_database"):
@@ -12,12 +18,77 @@ def create_database(client: MongoClient, db_name: str = "mafia_database"):
 
     db.create_collection("users")
     db.create_collection("game_rooms")
+    db.create_collection("game_rooms_archive")
+    db.create_collection("events")
+    db.create_collection("event_counters")
 
     print("Database and collections created successfully.")
 
     return db
 
 
+def ensure_indexes(db: Database):
+    """
+    Create indexes for every query issued by the routines.
+
+    Creating an index that already exists is a no-op, so it is safe to call this on every service start.
+    """
+    users = db.get_collection("users")
+    users.create_index("tg_id", unique=True, name="tg_id_unique")
+
+    rooms = db.get_collection("game_rooms")
+    rooms.create_index("room_id", unique=True, name="room_id_unique")
+    # only open rooms are looked up by state, so there is no need to index the whole history
+    rooms.create_index(
+        "room_state",
+        name="open_rooms",
+        partialFilterExpression={"room_state": RoomState.CREATED.value},
+    )
+    # started games recovered after a restart, see `async_routines.find_recoverable_rooms`;
+    # newest first is the order recovery reads them in
+    rooms.create_index(
+        [("room_state", ASCENDING), ("last_activity_at", DESCENDING)],
+        name="started_rooms_activity",
+        partialFilterExpression={"room_state": RoomState.STARTED.value},
+    )
+    rooms.create_index(
+        [("room_state", ASCENDING), ("deadline", ASCENDING)],
+        name="started_rooms_deadline",
+        partialFilterExpression={"room_state": RoomState.STARTED.value},
+    )
+    # finished games moved to the archive by the maintenance task, see `async_routines.run_maintenance`
+    rooms.create_index(
+        [("room_state", ASCENDING), ("last_activity_at", ASCENDING)],
+        name="ended_rooms_activity",
+        partialFilterExpression={"room_state": RoomState.ENDED.value},
+    )
+    # open rooms nobody has touched for a long time are deleted by the server,
+    # in case the maintenance task (see `async_routines.maintain_rooms`) is not running
+    idle_rooms = {
+        "name": "idle_rooms_ttl",
+        "expireAfterSeconds": int(config.idle_room_ttl),
+        "partialFilterExpression": {"room_state": RoomState.CREATED.value},
+    }
+    try:
+        rooms.create_index("last_activity_at", **idle_rooms)
+    except OperationFailure:
+        # the index exists with another ttl
+        db.command(
+            "collMod", rooms.name, index={"name": idle_rooms["name"], "expireAfterSeconds": int(config.idle_room_ttl)}
+        )
+
+    events = db.get_collection("events")
+    room_seq = [("room_id", ASCENDING), ("seq", ASCENDING)]
+    try:
+        events.create_index(room_seq, unique=True, name="room_seq")
+    except OperationFailure:
+        # the index was created before it became unique
+        events.drop_index("room_seq")
+        events.create_index(room_seq, unique=True, name="room_seq")
+
+    print("Indexes ensured successfully.")
+
+
 def define_schema(db: Database):
     """
     This will ensure that only valid records are stored in a database.
@@ -65,9 +136,10 @@ def define_schema(db: Database):
 def main():
     """create mongodb database"""
     cfg = load_config().db
-    client = MongoClient(host=cfg.host, port=cfg.port)
+    client = get_client()
 
     if cfg.clear_previous:
         client.drop_database(cfg.name)
 
-    create_database(client, db_name=cfg.name)
+    db = create_database(client, db_name=cfg.name)
+    ensure_indexes(db)
@@ -0,0 +1,20 @@
+"""
+Bookkeeping for per-turn room snapshots.
+
+Every write routine bumps the generation of the room it touched,
+which invalidates all snapshots of this room taken before the write.
+See :py:func:`ai_mafia.db.async_routines.room_snapshot`.
+"""
+
+from bson.objectid import ObjectId
+
+_generations: dict[str, int] = {}
+
+
+def invalidate_room(room_db_id: ObjectId):
+    key = str(room_db_id)
+    _generations[key] = _generations.get(key, 0) + 1
+
+
+def room_generation(room_db_id: ObjectId) -> int:
+    return _generations.get(str(room_db_id), 0)
@@ -0,0 +1,31 @@
+"""
+Pluggable storage engines behind :py:mod:`ai_mafia.db.async_routines`.
+
+The engine is chosen by ``db.backend`` in config. Game logic only talks to the repositories
+defined in :py:mod:`.base`, so a new engine only has to implement them.
+"""
+
+from ai_mafia.config import load_config
+
+from .base import EventsRepository, RoomsRepository, Storage, UsersRepository
+
+__all__ = ["EventsRepository", "RoomsRepository", "Storage", "UsersRepository", "get_storage"]
+
+config = load_config().db
+
+_storage: Storage | None = None
+
+
+def get_storage() -> Storage:
+    """Return the storage engine selected in config, creating it on first use."""
+    global _storage  # noqa: PLW0603
+    if _storage is None:
+        if config.backend == "memory":
+            from .memory import memory_storage
+
+            _storage = memory_storage()
+        else:
+            from .mongo import mongo_storage
+
+            _storage = mongo_storage()
+    return _storage
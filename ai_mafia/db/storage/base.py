@@ -0,0 +1,156 @@
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from ai_mafia.db.models import EventModel, PlayerModel, RoomModel, UserModel
+from ai_mafia.types import PlayerRole, PlayerState, RoomState
+
+
+class UsersRepository(ABC):
+    """Storage of :py:class:`UserModel`. Every method is a single atomic operation."""
+
+    @abstractmethod
+    async def find_by_tg_id(self, tg_id: int) -> UserModel | None: ...
+
+    @abstractmethod
+    async def insert(self, user: UserModel) -> ObjectId:
+        """Store a new user and return its id."""
+
+    @abstractmethod
+    async def find_by_tg_ids(self, tg_ids: list[int]) -> list[UserModel]: ...
+
+    @abstractmethod
+    async def get_nickname(self, db_id: ObjectId) -> str: ...
+
+    @abstractmethod
+    async def get_win_counter(self, db_id: ObjectId) -> int: ...
+
+    @abstractmethod
+    async def increment_win_counter(self, db_id: ObjectId) -> int:
+        """Increment win counter by 1 and return resulting value."""
+
+    @abstractmethod
+    async def settle(self, room: RoomModel, black_won: bool):
+        """Count the game for every participant of the room and the win for the winners."""
+
+
+class RoomsRepository(ABC):
+    """
+    Storage of :py:class:`RoomModel`. Every method is a single atomic operation.
+
+    Mutations return the updated room or None if the room does not satisfy the conditions of the mutation.
+    """
+
+    @abstractmethod
+    async def find_by_room_id(self, room_id: str) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def find_by_db_id(self, room_db_id: ObjectId) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def exists(self, room_db_id: ObjectId) -> bool: ...
+
+    @abstractmethod
+    async def find_all(self) -> list[RoomModel]: ...
+
+    @abstractmethod
+    async def find_by_state(self, room_state: RoomState) -> list[RoomModel]: ...
+
+    @abstractmethod
+    async def find_recoverable(self, active_since: datetime) -> list[RoomModel]:
+        """Return started games with a pending phase timer or with activity since `active_since`, newest first."""
+
+    @abstractmethod
+    async def sample_open_room(self) -> RoomModel | None:
+        """Return a random open room with a free seat, preferring the fuller ones."""
+
+    @abstractmethod
+    async def insert(self, room: RoomModel) -> ObjectId:
+        """Store a new room and return its id."""
+
+    @abstractmethod
+    async def set_player_state(
+        self, user_db_id: ObjectId, room_db_id: ObjectId, state: PlayerState
+    ) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def join(self, player: PlayerModel, room_db_id: ObjectId) -> RoomModel | None:
+        """Seat the player if the room is not started, has a free seat and does not have this player yet."""
+
+    @abstractmethod
+    async def exit(self, user_db_id: ObjectId, room_db_id: ObjectId) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def start_game(self, room_db_id: ObjectId, roles: list[PlayerRole]) -> RoomModel | None:
+        """Deal roles and numbers to the players in their joining order, if the game is not started yet."""
+
+    @abstractmethod
+    async def shoot(self, room_db_id: ObjectId, player_number: int) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def murder(self, room_id: str) -> RoomModel | None:
+        """Apply :py:meth:`RoomModel.kill` and return the room as it was **before** the murder."""
+
+    @abstractmethod
+    async def end_game(self, room_db_id: ObjectId) -> RoomModel | None:
+        """Mark a started game as ended."""
+
+    @abstractmethod
+    async def update_last_words(self, room_id: str, msg: str) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def set_deadline(self, room_db_id: ObjectId, signal: str, deadline: float) -> RoomModel | None: ...
+
+    @abstractmethod
+    async def clear_deadline(self, room_db_id: ObjectId, deadline: float) -> RoomModel | None:
+        """Clear the deadline once its signal is sent, unless a newer deadline has been set since."""
+
+    @abstractmethod
+    async def compare_and_set(self, room_db_id: ObjectId, version: int, fields: dict) -> RoomModel | None:
+        """
+        Set top-level `fields` (json-dumped values) only if the room still has `version`.
+        Return None on a version conflict.
+        """
+
+    @abstractmethod
+    async def archive_ended_rooms(self, cutoff: datetime, limit: int) -> list[ObjectId]:
+        """Move up to `limit` rooms of games ended before `cutoff` to the archive. Return their ids."""
+
+    @abstractmethod
+    async def expire_idle_rooms(self, cutoff: datetime, limit: int) -> list[ObjectId]:
+        """Delete up to `limit` open rooms with no activity since `cutoff`. Return their ids."""
+
+    @abstractmethod
+    def watch(self) -> AsyncIterator[tuple[ObjectId, RoomModel | None]]:
+        """
+        Yield ``(room_db_id, room)`` for every room changed by another process, ``room`` is None for deleted rooms.
+        Return immediately if the storage is not shared with other processes.
+        """
+
+
+class EventsRepository(ABC):
+    """Append-only storage of :py:class:`EventModel`."""
+
+    @abstractmethod
+    async def insert_many(self, events: list[EventModel]):
+        """Store a batch of events. Events of the batch are independent, a failed one does not stop the rest."""
+
+    @abstractmethod
+    async def reserve_seqs(self, room_id: str, count: int) -> int:
+        """
+        Reserve `count` consecutive values of :py:attr:`EventModel.seq` for the room and return the first one.
+        A value is never handed out twice, whatever the number of processes and restarts.
+        """
+
+    @abstractmethod
+    async def find_by_room(self, room_id: str) -> list[EventModel]:
+        """Return events of the room ordered by ``seq``."""
+
+
+class Storage:
+    def __init__(self, users: UsersRepository, rooms: RoomsRepository, events: EventsRepository):
+        self.users = users
+        self.rooms = rooms
+        self.events = events
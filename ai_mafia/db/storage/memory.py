@@ -0,0 +1,292 @@
+"""
+In-memory storage engine.
+
+Keeps everything in dictionaries of the current process, so it needs no database server and is meant
+for local runs and tests. None of the methods awaits anything between reading and writing a record,
+so within one event loop every operation is as atomic as its MongoDB counterpart.
+Records are copied on the way in and out, so callers can not mutate the stored state.
+"""
+
+import random
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from typing import TypeVar
+
+from bson.objectid import ObjectId
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db.models import EventModel, PlayerModel, RoomModel, UserModel
+from ai_mafia.db.queries import RANDOM_ROOM_CANDIDATES
+from ai_mafia.types import PlayerRole, PlayerState, RoomState
+
+from .base import EventsRepository, RoomsRepository, Storage, UsersRepository
+
+ModelT = TypeVar("ModelT", UserModel, RoomModel)
+
+
+def _copy(record: ModelT | None) -> ModelT | None:
+    """
+    Detached copy of a stored record.
+
+    Records are trusted, but re-validating a dump is still about 4x faster than ``model_copy(deep=True)``:
+    validation runs in pydantic-core, while a deep copy walks every object in Python.
+    """
+    return None if record is None else type(record).model_validate(record.model_dump(by_alias=True))
+
+
+class MemoryUsersRepository(UsersRepository):
+    def __init__(self):
+        self._users: dict[ObjectId, UserModel] = {}
+        self._tg_ids: dict[int, ObjectId] = {}
+
+    async def find_by_tg_id(self, tg_id: int) -> UserModel | None:
+        db_id = self._tg_ids.get(tg_id)
+        if db_id is None:
+            return None
+        return _copy(self._users[db_id])
+
+    async def insert(self, user: UserModel) -> ObjectId:
+        if user.tg_id in self._tg_ids:
+            msg = f"User with tg_id={user.tg_id} already exists"
+            raise ValueError(msg)
+        db_id = ObjectId()
+        self._users[db_id] = user.model_copy(update={"db_id": db_id}, deep=True)
+        self._tg_ids[user.tg_id] = db_id
+        return db_id
+
+    async def find_by_tg_ids(self, tg_ids: list[int]) -> list[UserModel]:
+        return [_copy(self._users[self._tg_ids[tg_id]]) for tg_id in tg_ids if tg_id in self._tg_ids]
+
+    async def get_nickname(self, db_id: ObjectId) -> str:
+        return self._users[db_id].tg_nickname
+
+    async def get_win_counter(self, db_id: ObjectId) -> int:
+        return self._users[db_id].win_counter
+
+    async def increment_win_counter(self, db_id: ObjectId) -> int:
+        user = self._users[db_id]
+        user.win_counter += 1
+        return user.win_counter
+
+    async def settle(self, room: RoomModel, black_won: bool):
+        for player in room.list_players:
+            user = self._users.get(ObjectId(player.user_id))
+            if user is None:
+                continue
+            user.game_counter += 1
+            if player.role.is_black() == black_won:
+                user.win_counter += 1
+
+
+def _touch(room: RoomModel):
+    room.version += 1
+    room.last_activity_at = datetime.now(timezone.utc)
+
+
+class MemoryRoomsRepository(RoomsRepository):
+    def __init__(self):
+        self._rooms: dict[ObjectId, RoomModel] = {}
+        self._room_ids: dict[str, ObjectId] = {}
+        self._archive: dict[ObjectId, RoomModel] = {}
+
+    async def find_by_room_id(self, room_id: str) -> RoomModel | None:
+        db_id = self._room_ids.get(room_id)
+        return None if db_id is None else _copy(self._rooms[db_id])
+
+    async def find_by_db_id(self, room_db_id: ObjectId) -> RoomModel | None:
+        return _copy(self._rooms.get(room_db_id))
+
+    async def exists(self, room_db_id: ObjectId) -> bool:
+        return room_db_id in self._rooms
+
+    async def find_all(self) -> list[RoomModel]:
+        return [_copy(room) for room in self._rooms.values()]
+
+    async def find_by_state(self, room_state: RoomState) -> list[RoomModel]:
+        return [_copy(room) for room in self._rooms.values() if room.room_state == room_state]
+
+    async def find_recoverable(self, active_since: datetime) -> list[RoomModel]:
+        rooms = [
+            room
+            for room in self._rooms.values()
+            if room.room_state == RoomState.STARTED
+            and (room.deadline is not None or room.last_activity_at >= active_since)
+        ]
+        return [_copy(room) for room in sorted(rooms, key=lambda room: room.last_activity_at, reverse=True)]
+
+    async def sample_open_room(self) -> RoomModel | None:
+        candidates = [room for room in self._rooms.values() if self._has_free_seat(room)]
+        if not candidates:
+            return None
+        candidates = random.sample(candidates, min(RANDOM_ROOM_CANDIDATES, len(candidates)))
+        return _copy(max(candidates, key=lambda room: len(room.list_players)))
+
+    async def insert(self, room: RoomModel) -> ObjectId:
+        if room.room_id in self._room_ids:
+            msg = f"Room with room_id={room.room_id} already exists"
+            raise ValueError(msg)
+        db_id = ObjectId()
+        self._rooms[db_id] = room.model_copy(update={"db_id": db_id}, deep=True)
+        self._room_ids[room.room_id] = db_id
+        return db_id
+
+    async def set_player_state(
+        self, user_db_id: ObjectId, room_db_id: ObjectId, state: PlayerState
+    ) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        player = None if room is None else room.get_player(str(user_db_id))
+        if player is None:
+            return None
+        player.state = state
+        _touch(room)
+        return _copy(room)
+
+    async def join(self, player: PlayerModel, room_db_id: ObjectId) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None or not self._has_free_seat(room) or room.get_player(player.user_id) is not None:
+            return None
+        room.list_players.append(player.model_copy(deep=True))
+        _touch(room)
+        return _copy(room)
+
+    async def exit(self, user_db_id: ObjectId, room_db_id: ObjectId) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        player = None if room is None else room.get_player(str(user_db_id))
+        if player is None:
+            return None
+        room.list_players.remove(player)
+        _touch(room)
+        return _copy(room)
+
+    async def start_game(self, room_db_id: ObjectId, roles: list[PlayerRole]) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None or room.room_state != RoomState.CREATED:
+            return None
+        for i, (player, role) in enumerate(zip(room.list_players, roles, strict=False)):
+            player.state = PlayerState.ALIVE
+            player.role = role
+            player.number = i + 1
+        room.room_state = RoomState.STARTED
+        _touch(room)
+        return _copy(room)
+
+    async def shoot(self, room_db_id: ObjectId, player_number: int) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None:
+            return None
+        for player in room.list_players:
+            if player.number == player_number:
+                player.shoot_cnt += 1
+                _touch(room)
+                return _copy(room)
+        return None
+
+    async def murder(self, room_id: str) -> RoomModel | None:
+        db_id = self._room_ids.get(room_id)
+        if db_id is None:
+            return None
+        room = self._rooms[db_id]
+        before = _copy(room)
+        room.kill()
+        _touch(room)
+        return before
+
+    async def end_game(self, room_db_id: ObjectId) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None or room.room_state != RoomState.STARTED:
+            return None
+        room.room_state = RoomState.ENDED
+        _touch(room)
+        return _copy(room)
+
+    async def update_last_words(self, room_id: str, msg: str) -> RoomModel | None:
+        db_id = self._room_ids.get(room_id)
+        if db_id is None:
+            return None
+        room = self._rooms[db_id]
+        room.last_words = msg
+        _touch(room)
+        return _copy(room)
+
+    async def set_deadline(self, room_db_id: ObjectId, signal: str, deadline: float) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None:
+            return None
+        room.pending_signal = signal
+        room.deadline = deadline
+        _touch(room)
+        return _copy(room)
+
+    async def clear_deadline(self, room_db_id: ObjectId, deadline: float) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None or room.deadline != deadline:
+            return None
+        room.pending_signal = None
+        room.deadline = None
+        _touch(room)
+        return _copy(room)
+
+    async def compare_and_set(self, room_db_id: ObjectId, version: int, fields: dict) -> RoomModel | None:
+        room = self._rooms.get(room_db_id)
+        if room is None or room.version != version:
+            return None
+        room = RoomModel.model_validate({**room.model_dump(by_alias=True), **fields})
+        _touch(room)
+        self._rooms[room_db_id] = room
+        return _copy(room)
+
+    async def archive_ended_rooms(self, cutoff: datetime, limit: int) -> list[ObjectId]:
+        ids = self._find_inactive(RoomState.ENDED, cutoff, limit)
+        for room_db_id in ids:
+            self._archive[room_db_id] = self._remove(room_db_id)
+        return ids
+
+    async def expire_idle_rooms(self, cutoff: datetime, limit: int) -> list[ObjectId]:
+        ids = self._find_inactive(RoomState.CREATED, cutoff, limit)
+        for room_db_id in ids:
+            self._remove(room_db_id)
+        return ids
+
+    def _find_inactive(self, room_state: RoomState, cutoff: datetime, limit: int) -> list[ObjectId]:
+        ids = [
+            room_db_id
+            for room_db_id, room in self._rooms.items()
+            if room.room_state == room_state and room.last_activity_at < cutoff
+        ]
+        return ids[:limit]
+
+    def _remove(self, room_db_id: ObjectId) -> RoomModel:
+        room = self._rooms.pop(room_db_id)
+        del self._room_ids[room.room_id]
+        return room
+
+    async def watch(self) -> AsyncIterator[tuple[ObjectId, RoomModel | None]]:
+        # nobody else writes to this storage
+        return
+        yield
+
+    @staticmethod
+    def _has_free_seat(room: RoomModel) -> bool:
+        return room.room_state == RoomState.CREATED and len(room.list_players) < MAX_PLAYERS
+
+
+class MemoryEventsRepository(EventsRepository):
+    def __init__(self):
+        self._events: dict[str, list[EventModel]] = {}
+        self._seqs: dict[str, int] = {}
+
+    async def insert_many(self, events: list[EventModel]):
+        for event in events:
+            self._events.setdefault(event.room_id, []).append(event.model_copy())
+
+    async def reserve_seqs(self, room_id: str, count: int) -> int:
+        first = self._seqs.get(room_id, 0)
+        self._seqs[room_id] = first + count
+        return first
+
+    async def find_by_room(self, room_id: str) -> list[EventModel]:
+        return sorted((event.model_copy() for event in self._events.get(room_id, [])), key=lambda event: event.seq)
+
+
+def memory_storage() -> Storage:
+    return Storage(users=MemoryUsersRepository(), rooms=MemoryRoomsRepository(), events=MemoryEventsRepository())
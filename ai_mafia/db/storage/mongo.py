@@ -0,0 +1,230 @@
+"""MongoDB storage engine built on the asyncio API of pymongo."""
+
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import BulkWriteError
+
+from ai_mafia.db.client import get_async_database
+from ai_mafia.db.models import EventModel, PlayerModel, RoomModel, UserModel
+from ai_mafia.db.queries import (
+    clear_deadline_query,
+    compare_and_set_query,
+    end_game_query,
+    ended_rooms_filter,
+    event_document,
+    exit_room_query,
+    idle_rooms_filter,
+    join_room_query,
+    last_words_query,
+    murder_query,
+    random_room_pipeline,
+    recoverable_rooms_filter,
+    room_document,
+    set_deadline_query,
+    set_player_state_query,
+    settle_game_requests,
+    shoot_query,
+    start_game_query,
+)
+from ai_mafia.types import PlayerRole, PlayerState, RoomState
+
+from .base import EventsRepository, RoomsRepository, Storage, UsersRepository
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def users_collection() -> AsyncCollection:
+    return get_async_database().get_collection("users")
+
+
+def rooms_collection() -> AsyncCollection:
+    return get_async_database().get_collection("game_rooms")
+
+
+def archive_collection() -> AsyncCollection:
+    return get_async_database().get_collection("game_rooms_archive")
+
+
+def events_collection() -> AsyncCollection:
+    return get_async_database().get_collection("events")
+
+
+def event_counters_collection() -> AsyncCollection:
+    return get_async_database().get_collection("event_counters")
+
+
+def _room(doc: dict | None) -> RoomModel | None:
+    return None if doc is None else RoomModel(**doc)
+
+
+class MongoUsersRepository(UsersRepository):
+    async def find_by_tg_id(self, tg_id: int) -> UserModel | None:
+        result = await users_collection().find_one({"tg_id": tg_id})
+        if result is None:
+            return None
+        return UserModel(**result)
+
+    async def insert(self, user: UserModel) -> ObjectId:
+        result = await users_collection().insert_one(user.model_dump())
+        return result.inserted_id
+
+    async def find_by_tg_ids(self, tg_ids: list[int]) -> list[UserModel]:
+        return [UserModel(**doc) async for doc in users_collection().find({"tg_id": {"$in": tg_ids}})]
+
+    async def get_nickname(self, db_id: ObjectId) -> str:
+        result = await users_collection().find_one({"_id": db_id}, projection={"_id": False, "tg_nickname": True})
+        return result["tg_nickname"]
+
+    async def get_win_counter(self, db_id: ObjectId) -> int:
+        result = await users_collection().find_one({"_id": db_id}, projection={"_id": False, "win_counter": True})
+        return result["win_counter"]
+
+    async def increment_win_counter(self, db_id: ObjectId) -> int:
+        result = await users_collection().find_one_and_update(
+            {"_id": db_id},
+            {"$inc": {"win_counter": 1}},
+            projection={"_id": False, "win_counter": True},
+            return_document=ReturnDocument.AFTER,
+        )
+        return result["win_counter"]
+
+    async def settle(self, room: RoomModel, black_won: bool):
+        await users_collection().bulk_write(settle_game_requests(room, black_won), ordered=False)
+
+
+class MongoRoomsRepository(RoomsRepository):
+    async def find_by_room_id(self, room_id: str) -> RoomModel | None:
+        return _room(await rooms_collection().find_one({"room_id": room_id}))
+
+    async def find_by_db_id(self, room_db_id: ObjectId) -> RoomModel | None:
+        return _room(await rooms_collection().find_one({"_id": room_db_id}))
+
+    async def exists(self, room_db_id: ObjectId) -> bool:
+        return await rooms_collection().count_documents({"_id": room_db_id}, limit=1) > 0
+
+    async def find_all(self) -> list[RoomModel]:
+        return [RoomModel(**doc) async for doc in rooms_collection().find()]
+
+    async def find_by_state(self, room_state: RoomState) -> list[RoomModel]:
+        return [RoomModel(**doc) async for doc in rooms_collection().find({"room_state": room_state.value})]
+
+    async def find_recoverable(self, active_since: datetime) -> list[RoomModel]:
+        cursor = rooms_collection().find(recoverable_rooms_filter(active_since)).sort("last_activity_at", DESCENDING)
+        return [RoomModel(**doc) async for doc in cursor]
+
+    async def sample_open_room(self) -> RoomModel | None:
+        cursor = await rooms_collection().aggregate(random_room_pipeline())
+        list_room = await cursor.to_list()
+        if len(list_room) == 0:
+            return None
+        return RoomModel(**list_room[0])
+
+    async def insert(self, room: RoomModel) -> ObjectId:
+        result = await rooms_collection().insert_one(room_document(room))
+        return result.inserted_id
+
+    async def set_player_state(
+        self, user_db_id: ObjectId, room_db_id: ObjectId, state: PlayerState
+    ) -> RoomModel | None:
+        query, update = set_player_state_query(user_db_id, room_db_id, state)
+        return await self._update(query, update)
+
+    async def join(self, player: PlayerModel, room_db_id: ObjectId) -> RoomModel | None:
+        query, update = join_room_query(player.model_dump(mode="json"), room_db_id)
+        return await self._update(query, update)
+
+    async def exit(self, user_db_id: ObjectId, room_db_id: ObjectId) -> RoomModel | None:
+        query, update = exit_room_query(user_db_id, room_db_id)
+        return await self._update(query, update)
+
+    async def start_game(self, room_db_id: ObjectId, roles: list[PlayerRole]) -> RoomModel | None:
+        query, update = start_game_query(room_db_id, roles)
+        return await self._update(query, update)
+
+    async def shoot(self, room_db_id: ObjectId, player_number: int) -> RoomModel | None:
+        query, update = shoot_query(room_db_id, player_number)
+        return await self._update(query, update)
+
+    async def murder(self, room_id: str) -> RoomModel | None:
+        query, update = murder_query(room_id)
+        return await self._update(query, update, return_document=ReturnDocument.BEFORE)
+
+    async def end_game(self, room_db_id: ObjectId) -> RoomModel | None:
+        query, update = end_game_query(room_db_id)
+        return await self._update(query, update)
+
+    async def update_last_words(self, room_id: str, msg: str) -> RoomModel | None:
+        query, update = last_words_query(room_id, msg)
+        return await self._update(query, update)
+
+    async def set_deadline(self, room_db_id: ObjectId, signal: str, deadline: float) -> RoomModel | None:
+        query, update = set_deadline_query(room_db_id, signal, deadline)
+        return await self._update(query, update)
+
+    async def clear_deadline(self, room_db_id: ObjectId, deadline: float) -> RoomModel | None:
+        query, update = clear_deadline_query(room_db_id, deadline)
+        return await self._update(query, update)
+
+    async def compare_and_set(self, room_db_id: ObjectId, version: int, fields: dict) -> RoomModel | None:
+        query, update = compare_and_set_query(room_db_id, version, fields)
+        return await self._update(query, update)
+
+    async def archive_ended_rooms(self, cutoff: datetime, limit: int) -> list[ObjectId]:
+        docs = await rooms_collection().find(ended_rooms_filter(cutoff)).limit(limit).to_list()
+        if not docs:
+            return []
+        try:
+            await archive_collection().insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            # rooms archived by a previous run that failed before deleting them
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in exc.details["writeErrors"]):
+                raise
+        ids = [doc["_id"] for doc in docs]
+        await rooms_collection().delete_many({"_id": {"$in": ids}})
+        return ids
+
+    async def expire_idle_rooms(self, cutoff: datetime, limit: int) -> list[ObjectId]:
+        query = idle_rooms_filter(cutoff)
+        docs = await rooms_collection().find(query, projection={"_id": True}).limit(limit).to_list()
+        ids = [doc["_id"] for doc in docs]
+        if not ids:
+            return []
+        # the filter is checked again, so that a room joined in the meantime survives
+        result = await rooms_collection().delete_many({"_id": {"$in": ids}, **query})
+        if result.deleted_count < len(ids):
+            survived = set(await rooms_collection().distinct("_id", {"_id": {"$in": ids}}))
+            ids = [room_db_id for room_db_id in ids if room_db_id not in survived]
+        return ids
+
+    async def watch(self) -> AsyncIterator[tuple[ObjectId, RoomModel | None]]:
+        async with await rooms_collection().watch(full_document="updateLookup") as stream:
+            async for change in stream:
+                yield change["documentKey"]["_id"], _room(change.get("fullDocument"))
+
+    async def _update(
+        self, query: dict, update: dict | list, return_document: bool = ReturnDocument.AFTER
+    ) -> RoomModel | None:
+        return _room(await rooms_collection().find_one_and_update(query, update, return_document=return_document))
+
+
+class MongoEventsRepository(EventsRepository):
+    async def insert_many(self, events: list[EventModel]):
+        await events_collection().insert_many([event_document(event) for event in events], ordered=False)
+
+    async def reserve_seqs(self, room_id: str, count: int) -> int:
+        counter = await event_counters_collection().find_one_and_update(
+            {"_id": room_id}, {"$inc": {"seq": count}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"] - count
+
+    async def find_by_room(self, room_id: str) -> list[EventModel]:
+        cursor = events_collection().find({"room_id": room_id}, projection={"_id": False}).sort("seq")
+        return [EventModel(**doc) async for doc in cursor]
+
+
+def mongo_storage() -> Storage:
+    return Storage(users=MongoUsersRepository(), rooms=MongoRoomsRepository(), events=MongoEventsRepository())
@@ -0,0 +1,64 @@
+"""
+Asyncio HTTP client shared by calls between our services.
+
+One client per process keeps connections alive and pools them, so a call does not pay for a new
+TCP connection and never blocks the event loop.
+"""
+
+import asyncio
+import random
+
+import httpx
+
+from ai_mafia.config import load_config
+
+config = load_config().http
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client  # noqa: PLW0603
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    if _client is not None:
+        await _client.aclose()
+
+
+async def _post(url: str, **kwargs) -> httpx.Response:
+    response = await get_http_client().post(url, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+async def post(url: str, *, idempotent: bool, **kwargs) -> httpx.Response:
+    """
+    Send a POST request, retrying failures up to ``http.retries`` times with exponential backoff and full jitter.
+
+    Requests that were never sent (the connection failed) are always retried. Other failures,
+    i.e. timeouts and server errors, are retried only if repeating the request is harmless (`idempotent`).
+    Raise :py:class:`httpx.HTTPError` if all attempts fail.
+    """
+    for attempt in range(config.retries):
+        try:
+            return await _post(url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            pass
+        except httpx.HTTPStatusError as exc:
+            if not idempotent or exc.response.is_client_error:
+                raise
+        except httpx.HTTPError:
+            if not idempotent:
+                raise
+        await asyncio.sleep(random.uniform(0, config.backoff * 2**attempt))
+    return await _post(url, **kwargs)
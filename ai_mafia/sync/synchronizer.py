@@ -1,31 +1,55 @@
-import requests
+import asyncio
+from contextlib import asynccontextmanager
+
 from bson.objectid import ObjectId
 from fastapi import FastAPI
 
 from ai_mafia.config import load_config
-from ai_mafia.db.routines import set_player_state
+from ai_mafia.db.async_routines import set_player_state, watch_room_changes
+from ai_mafia.http_client import close_http_client, post
+from ai_mafia.tg_proxy import scheduler
 from ai_mafia.types import PlayerState
 
-from .polling import start_polling
+from .waiting import watchers
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # players get ready through other processes too, their writes arrive through the change stream
+    room_changes_watcher = asyncio.create_task(watch_room_changes())
+    timers = asyncio.create_task(scheduler.run())
+    yield
+    watchers.cancel_all()
+    timers.cancel()
+    room_changes_watcher.cancel()
+    await close_http_client()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 config = load_config().sync
 
 
 @app.post("/player_is_ready")
-async def player_is_ready(user_db_id: str, room_db_id: str, ctx_id: str) -> None:
-    set_player_state(user_db_id=ObjectId(user_db_id), room_db_id=ObjectId(room_db_id), state=PlayerState.READY)
-    await start_polling(ObjectId(room_db_id), ctx_id, interval=1)
+async def player_is_ready(user_db_id: str, room_db_id: str) -> None:
+    room = await set_player_state(
+        user_db_id=ObjectId(user_db_id), room_db_id=ObjectId(room_db_id), state=PlayerState.READY
+    )
+    watchers.start(room)
+
+
+@app.get("/watchers")
+async def watchers_stats() -> dict:
+    return {"active": len(watchers)}
 
 
-def send_ready_signal(user_db_id: ObjectId, room_db_id: ObjectId, ctx_id):
-    requests.post(
-        url=config.make_endpoint("player_is_ready"),
+async def send_ready_signal(user_db_id: ObjectId, room_db_id: ObjectId):
+    # marking a player ready twice is harmless, so the request is safe to retry
+    await post(
+        config.make_endpoint("player_is_ready"),
+        idempotent=True,
         params={
             "user_db_id": str(user_db_id),
             "room_db_id": str(room_db_id),
-            "ctx_id": str(ctx_id),
         },
-        timeout=5,
     )
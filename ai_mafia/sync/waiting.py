@@ -0,0 +1,60 @@
+"""
+Waiting for rooms to get ready.
+
+Each room is watched by at most one task, no matter how many of its players report readiness,
+and the task does no database reads while it waits (see :py:mod:`ai_mafia.db.readiness`).
+"""
+
+import asyncio
+
+from bson.objectid import ObjectId
+
+from ai_mafia.db.async_routines import find_game_room
+from ai_mafia.db.models import RoomModel
+from ai_mafia.db.readiness import readiness
+from ai_mafia.tg_proxy import send_signal
+from ai_mafia.types import RoomState
+
+
+async def watch_room(room: RoomModel):
+    """Send the ready signal to every player as soon as all of them are ready."""
+    future = readiness.watch(room.db_id)
+    try:
+        # the room may have got ready before we started watching
+        readiness.update(await find_game_room(room.room_id) or room)
+        room = await future
+    finally:
+        readiness.discard(room.db_id)
+    if room.room_state == RoomState.CREATED and room.is_room_ready(readiness.n_players):
+        print(f"Room {room.room_id} is ready")
+        send_signal(room, "_ready_")
+
+
+class RoomWatchers:
+    """Registry of :py:func:`watch_room` tasks, one per room. Tasks are referenced here until they are done."""
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, room_db_id: ObjectId):
+        return str(room_db_id) in self._tasks
+
+    def start(self, room: RoomModel) -> asyncio.Task:
+        """Start watching the room, unless it is already watched."""
+        key = str(room.db_id)
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(watch_room(room))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    def cancel_all(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+
+watchers = RoomWatchers()
@@ -1,4 +1,16 @@
+from .bot_app import build_application, serve_with_script
 from .chatsky_web_api import app as chatsky_web_api
+from .chatsky_web_api import (
+    broadcast,
+    cancel_timer,
+    notify_room,
+    process_update,
+    resume_timer,
+    send_message_to_others,
+    send_signal,
+    start_timer,
+    startup_hooks,
+)
 from .chatsky_web_api import interface as chatsky_web_interface
-from .chatsky_web_api import send_message_to_others, send_signal
 from .converting import tg_update_to_chatsky_message
+from .scheduler import scheduler
@@ -0,0 +1,103 @@
+"""
+Telegram bot application that hands updates to the script and replies with its responses.
+
+The script is reached over ``POST /chat`` by default (see ``tg_proxy.py``),
+or in memory when both run in one process (see :py:func:`serve_with_script`).
+"""
+
+import asyncio
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from functools import partial
+
+import httpx
+import uvicorn
+from chatsky import Message
+from fastapi import FastAPI
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, CallbackContext, CallbackQueryHandler, MessageHandler, filters
+
+from ai_mafia.config import load_config
+from ai_mafia.http_client import close_http_client, post
+
+from .chatsky_web_api import process_update
+from .converting import tg_update_to_chatsky_message
+
+logger = logging.getLogger(__name__)
+
+config = load_config().chatsky
+
+
+async def forward_over_http(update: Update) -> Message:
+    msg = tg_update_to_chatsky_message(update).model_dump(mode="json")
+    # the script must not process an update twice, so only requests that were never sent are retried
+    response = await post(config.make_endpoint("chat"), idempotent=False, json=msg)
+    return Message(**response.json())
+
+
+async def handle_message(
+    update: Update, context: CallbackContext, forward: Callable[[Update], Awaitable[Message]] = forward_over_http
+) -> None:
+    try:
+        msg = await forward(update)
+        keyboard = None
+        if hasattr(msg, "reply_markup"):
+            keyboard = msg.reply_markup
+        if update.callback_query is None:
+            await update.message.reply_text(msg.text, reply_markup=keyboard)
+        else:
+            query = update.callback_query
+            await query.answer()
+            await context.bot.edit_message_text(
+                chat_id=query.message.chat_id, text=msg.text, reply_markup=keyboard, message_id=query.message.message_id
+            )
+    except httpx.HTTPError as e:
+        logger.exception("Error sending message to HTTP endpoint: %s", str(e))  # noqa: TRY401
+        if update.callback_query is None:
+            await update.message.reply_text("Failed to forward the message.")
+        else:
+            await update.callback_query.answer(text="Failed to forward the message.")
+
+
+async def post_shutdown(_: Application) -> None:
+    await close_http_client()
+
+
+def build_application(
+    *, polling: bool = True, forward: Callable[[Update], Awaitable[Message]] = forward_over_http
+) -> Application:
+    builder = ApplicationBuilder().token(os.environ["TG_TOKEN"]).post_shutdown(post_shutdown)
+    if not polling:
+        builder = builder.updater(None)
+    app = builder.build()
+
+    handler = partial(handle_message, forward=forward)
+    app.add_handler(MessageHandler(filters.TEXT, handler))
+    app.add_handler(CallbackQueryHandler(handler))
+    return app
+
+
+async def serve_with_script(script_app: FastAPI, host: str, port: int) -> None:
+    """
+    Serve the web API of the script and poll Telegram in one process (``chatsky.in_process``).
+    Updates are handed to the script in memory by :py:func:`process_update` instead of through ``/chat``.
+    """
+    server = uvicorn.Server(uvicorn.Config(script_app, host=host, port=port))
+    serving = asyncio.create_task(server.serve())
+    # the script is ready for updates when startup of its app, e.g. game recovery, is complete
+    while not server.started:
+        if serving.done():
+            await serving
+            return
+        await asyncio.sleep(0.1)
+    application = build_application(forward=process_update)
+    async with application:
+        await application.updater.start_polling()
+        await application.start()
+        try:
+            await serving
+        finally:
+            await application.updater.stop()
+            await application.stop()
+    await close_http_client()
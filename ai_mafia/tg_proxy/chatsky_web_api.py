@@ -1,5 +1,10 @@
 import asyncio
+import logging
 import os
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 import telegram as tg
 from chatsky import Message
@@ -8,18 +13,63 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 
 from ai_mafia.config import load_config
-from ai_mafia.db.models import RoomModel
+from ai_mafia.db.async_routines import (
+    cas_conflicts,
+    clear_deadline,
+    maintain_rooms,
+    rebuild_matchmaker,
+    set_deadline,
+    watch_room_changes,
+)
+from ai_mafia.db.cache import room_cache
+from ai_mafia.db.events import event_log
+from ai_mafia.db.models import PlayerModel, RoomModel
+
+from .converting import tg_update_to_chatsky_message
+from .outbox import Outbox, Priority
+from .scheduler import scheduler
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 config = load_config().chatsky
 
 interface = CallbackMessengerInterface()
 
-app = FastAPI()
+startup_hooks: list[Callable[[], Awaitable]] = []
+"""Coroutines awaited on app startup, e.g. recovery of games interrupted by a restart."""
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await rebuild_matchmaker()
+    room_changes_watcher = asyncio.create_task(watch_room_changes())
+    event_writer = asyncio.create_task(event_log.run())
+    room_maintainer = asyncio.create_task(maintain_rooms())
+    timers = asyncio.create_task(scheduler.run())
+    sender = asyncio.create_task(outbox.run())
+    for hook in startup_hooks:
+        await hook()
+    yield
+    sender.cancel()
+    timers.cancel()
+    room_changes_watcher.cancel()
+    room_maintainer.cancel()
+    event_writer.cancel()
+    # the writer flushes what is left in the buffer before it stops
+    await asyncio.gather(event_writer, return_exceptions=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 bot = tg.Bot(os.environ["TG_TOKEN"])
 
+outbox = Outbox(bot, load_config().telegram)
+
+_broadcast_turns = asyncio.Semaphore(config.broadcast_concurrency)
+_in_broadcast_turn: ContextVar[bool] = ContextVar("in_broadcast_turn", default=False)
+
 
 @app.post("/chat", response_model=Message)
 async def respond(
@@ -31,24 +81,116 @@ async def respond(
     return context.last_response
 
 
-async def send_message(ctx_id: str, chat_id: int, msg: str, time_sleep=5):
-    await asyncio.sleep(time_sleep)
-    context = await interface.on_request_async(Message(text=msg), ctx_id)
-    await bot.send_message(chat_id=chat_id, text=context.last_response.text)
+async def process_update(update: tg.Update) -> Message:
+    """Same as ``POST /chat`` for an update received by this process, without the HTTP round trip and JSON."""
+    user_message = tg_update_to_chatsky_message(update, serializable=False)
+    context = await interface.on_request_async(user_message, update.effective_user.id)
+    return context.last_response
+
+
+@app.get("/room_cache")
+async def room_cache_stats() -> dict:
+    return room_cache.stats()
+
+
+@app.get("/timers")
+async def timers_stats() -> dict:
+    return {"pending": len(scheduler)}
+
+
+@app.get("/outbox")
+async def outbox_stats() -> dict:
+    return outbox.stats()
+
+
+@app.get("/cas_conflicts")
+async def cas_conflicts_stats() -> dict:
+    return dict(cas_conflicts)
+
+
+async def send_message(ctx_id: str, chat_id: int, msg: str, priority: Priority = Priority.NORMAL) -> tg.Message | None:
+    if _in_broadcast_turn.get():
+        # a broadcast from inside a broadcast turn runs in the slot of that turn:
+        # waiting for another slot while holding one deadlocks once all slots are held this way
+        context = await interface.on_request_async(Message(text=msg), ctx_id)
+    else:
+        async with _broadcast_turns:
+            token = _in_broadcast_turn.set(True)
+            try:
+                context = await interface.on_request_async(Message(text=msg), ctx_id)
+            finally:
+                _in_broadcast_turn.reset(token)
+    return await outbox.send(chat_id, context.last_response.text, priority)
+
+
+async def broadcast(
+    room: RoomModel, msg: str, *, exclude_user_id: str | None = None, priority: Priority = Priority.CRITICAL
+) -> list[PlayerModel]:
+    """
+    Push `msg` through the script of every player of the room, except `exclude_user_id`, and send the responses.
+    Return when they are delivered, with the players it failed for.
+
+    Turns of all broadcasts share ``chatsky.broadcast_concurrency`` slots, so they do not crowd out players' clicks.
+    """
+    players = [player for player in room.list_players if player.user_id != exclude_user_id]
+    results = await asyncio.gather(
+        *(send_message(player.ctx_id, player.chat_id, msg, priority) for player in players),
+        return_exceptions=True,
+    )
+    failed = []
+    for player, result in zip(players, results, strict=True):
+        if isinstance(result, BaseException):
+            logger.error("Failed to run %s for player %s", msg, player.user_id, exc_info=result)
+        if isinstance(result, BaseException) or result is None:
+            failed.append(player)
+    if failed:
+        logger.warning(
+            "%s reached %d of %d players of room %s", msg, len(players) - len(failed), len(players), room.room_id
+        )
+    return failed
 
 
 def send_signal(room: RoomModel | None, msg: str = "_skip_", timer=5):
+    """Send `msg` to every player of the room in `timer` seconds, replacing the pending timer of the room."""
     if room is None:
         msg = "Room not found :("
         raise ValueError(msg)
-    coroutines = [send_message(player.ctx_id, player.chat_id, msg, timer) for player in room.list_players]
-    [asyncio.create_task(coro) for coro in coroutines]
+    scheduler.schedule(room.db_id, time.time() + timer, lambda: broadcast(room, msg))
 
 
-def send_message_to_others(room: RoomModel, user_id: str, msg: str):
+async def send_message_to_others(room: RoomModel, user_id: str, msg: str) -> list[PlayerModel]:
     """Send message from specific user to other players in room"""
-    coroutines = []
-    for player in room.list_players:
-        if player.user_id != user_id:
-            coroutines.append(send_message(player.ctx_id, player.chat_id, msg, 0))  # noqa: PERF401
-    [asyncio.create_task(coro) for coro in coroutines]
+    return await broadcast(room, msg, exclude_user_id=user_id, priority=Priority.NORMAL)
+
+
+async def start_timer(room: RoomModel, msg: str = "_skip_", timer: float = 5):
+    """
+    Same as :py:func:`send_signal`, but the timer is persisted in the room,
+    so that it is resumed by game recovery if the process restarts before it fires.
+    """
+    deadline = time.time() + timer
+    await set_deadline(room.db_id, msg, deadline)
+    resume_timer(room, msg, deadline)
+
+
+def resume_timer(room: RoomModel, msg: str, deadline: float):
+    """Send `msg` to every player of the room at `deadline` and clear the persisted timer."""
+    scheduler.schedule(room.db_id, deadline, lambda: _fire_timer(room, msg, deadline))
+
+
+async def _fire_timer(room: RoomModel, msg: str, deadline: float):
+    await broadcast(room, msg)
+    await clear_deadline(room.db_id, deadline)
+
+
+async def cancel_timer(room: RoomModel):
+    """Drop the pending timer of the room without sending its signal, e.g. when a phase ends early."""
+    scheduler.cancel(room.db_id)
+    if room.deadline is not None:
+        await clear_deadline(room.db_id, room.deadline)
+
+
+def notify_room(room: RoomModel, text: str, players: list[PlayerModel] | None = None):
+    """Send a text to every player of the room, or to `players` only, directly, bypassing the script."""
+    for player in room.list_players if players is None else players:
+        outbox.send(player.chat_id, text)
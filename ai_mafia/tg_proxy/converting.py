@@ -17,17 +17,19 @@ from chatsky.core.message import (
 from telegram import Update
 
 
-def tg_update_to_chatsky_message(update: Update) -> Message:  # noqa: C901, PLR0912
+def tg_update_to_chatsky_message(update: Update, *, serializable: bool = True) -> Message:  # noqa: C901, PLR0912
     """
     Convert Telegram update to Chatsky message.
     Extract text and supported attachments.
 
     :param update: Telegram update object.
+    :param serializable: Store the update in ``original_message`` as a dict, so that the message can be sent as JSON.
+        Otherwise the update object itself is stored, for a script in the same process.
     :return: Chatsky message object.
     """
 
     message = Message()
-    message.original_message = update.to_dict()
+    message.original_message = update.to_dict() if serializable else update
     message.attachments = []
 
     tg_msg = update.message
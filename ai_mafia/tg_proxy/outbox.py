@@ -0,0 +1,220 @@
+"""
+Outbound queue of messages sent by the bot.
+
+Telegram allows a bot about 30 messages per second overall and about one per second to a chat,
+and answers a burst above that with 429 errors. All messages of the process go through one
+:py:class:`Outbox` that spends a global token bucket and a bucket per chat, sends phase-critical
+messages first, waits out ``retry_after`` of rate limit errors and retries network errors.
+Messages of the same priority to one chat are delivered in the order they were queued.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import random
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+import telegram as tg
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from ai_mafia.config import TelegramConfig
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Lower value is sent first."""
+
+    CRITICAL = 0
+    """Signals of game phases: the game is stuck until they are delivered."""
+    NORMAL = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.0)
+
+    def take(self, now: float):
+        self._refill(now)
+        self._tokens -= 1
+
+    def pause(self, seconds: float, now: float):
+        """Give out no tokens for `seconds`, e.g. when Telegram asks to retry later."""
+        self._paused_until = max(self._paused_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and self._tokens >= self.burst
+
+
+@dataclass(order=True)
+class OutgoingMessage:
+    priority: Priority
+    seq: int
+    chat_id: int = field(compare=False)
+    text: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    queued_at: float = field(compare=False, default_factory=time.monotonic)
+    attempts: int = field(compare=False, default=0)
+
+
+class Outbox:
+    MAX_IDLE_BUCKETS = 4096
+    """Buckets of chats that are full and unused are dropped when there are more of them than this."""
+
+    def __init__(self, bot: tg.Bot, config: TelegramConfig):
+        self.bot = bot
+        self.config = config
+        self._heap: list[OutgoingMessage] = []
+        self._counter = itertools.count()
+        self._global = TokenBucket(config.rate_limit, config.rate_limit)
+        self._chats: dict[int, TokenBucket] = {}
+        self._in_flight: set[int] = set()
+        """Chats with a message being sent. The next message to such a chat waits, to keep the order."""
+        self._changed = asyncio.Event()
+        self._sending: set[asyncio.Task] = set()
+        self._latencies: deque[float] = deque(maxlen=config.latency_window)
+        self._counters = {"sent": 0, "failed": 0, "retried": 0, "rate_limited": 0}
+
+    def __len__(self):
+        """Number of queued messages."""
+        return len(self._heap)
+
+    def send(self, chat_id: int, text: str, priority: Priority = Priority.NORMAL) -> asyncio.Future:
+        """
+        Queue a message. The returned future is resolved with the sent :py:class:`telegram.Message`
+        or with None if the message could not be delivered. It need not be awaited.
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, OutgoingMessage(priority, next(self._counter), chat_id, text, future))
+        self._changed.set()
+        return future
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "queued": len(self._heap),
+            "queued_critical": sum(message.priority == Priority.CRITICAL for message in self._heap),
+            "in_flight": len(self._in_flight),
+            **self._counters,
+            "latency_avg": statistics.fmean(latencies) if latencies else None,
+            "latency_p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                self._chats = {chat: b for chat, b in self._chats.items() if not b.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.config.chat_rate_limit, self.config.chat_burst)
+        return bucket
+
+    def _pop_sendable(self, now: float) -> tuple[OutgoingMessage | None, float | None]:
+        """
+        Take the first message in priority order whose chat can be written to now.
+        Otherwise return the delay until some chat can be, or None if it depends on a message in flight.
+        """
+        skipped = []
+        message, delay = None, None
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            skipped.append(candidate)
+            if candidate.chat_id in self._in_flight:
+                continue
+            chat_delay = self._chat_bucket(candidate.chat_id).delay(now)
+            if chat_delay == 0:
+                message = skipped.pop()
+                break
+            delay = chat_delay if delay is None else min(delay, chat_delay)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return message, delay
+
+    async def run(self):
+        """Send queued messages within the rate limits. Runs until cancelled."""
+        while True:
+            self._changed.clear()
+            now = time.monotonic()
+            global_delay = self._global.delay(now)
+            if self._heap and global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+            message, delay = self._pop_sendable(now)
+            if message is None:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                continue
+            self._global.take(now)
+            self._chat_bucket(message.chat_id).take(now)
+            self._in_flight.add(message.chat_id)
+            task = asyncio.create_task(self._deliver(message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, message: OutgoingMessage):
+        message.attempts += 1
+        try:
+            sent = await self.bot.send_message(chat_id=message.chat_id, text=message.text)
+        except RetryAfter as exc:
+            self._counters["rate_limited"] += 1
+            self._retry(message, float(exc.retry_after), exc)
+        except BadRequest:
+            # a subclass of NetworkError, but sending the same request again fails the same way
+            logger.exception("Telegram rejected a message to chat %s", message.chat_id)
+            self._fail(message)
+        except NetworkError as exc:
+            self._retry(message, random.uniform(0, self.config.backoff * 2**message.attempts), exc)
+        except TelegramError:
+            logger.exception("Failed to send a message to chat %s", message.chat_id)
+            self._fail(message)
+        except asyncio.CancelledError:
+            # whoever awaits the message must not wait forever for a send that was abandoned
+            self._fail(message)
+            raise
+        except Exception:
+            # not a Telegram error, e.g. a response the library could not parse: retrying is unlikely to help
+            logger.exception("Unexpected error sending a message to chat %s", message.chat_id)
+            self._fail(message)
+        else:
+            self._counters["sent"] += 1
+            self._latencies.append(time.monotonic() - message.queued_at)
+            if not message.future.done():
+                message.future.set_result(sent)
+        finally:
+            self._in_flight.discard(message.chat_id)
+            self._changed.set()
+
+    def _retry(self, message: OutgoingMessage, delay: float, exc: TelegramError):
+        if message.attempts > self.config.send_retries:
+            logger.warning("Gave up sending a message to chat %s: %s", message.chat_id, exc)
+            self._fail(message)
+            return
+        self._counters["retried"] += 1
+        # the message keeps its place in the queue, and the chat waits, so later messages do not overtake it
+        self._chat_bucket(message.chat_id).pause(delay, time.monotonic())
+        heapq.heappush(self._heap, message)
+
+    def _fail(self, message: OutgoingMessage):
+        self._counters["failed"] += 1
+        if not message.future.done():
+            message.future.set_result(None)
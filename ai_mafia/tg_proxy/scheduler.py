@@ -0,0 +1,82 @@
+"""
+Timers of game phases.
+
+All timers of the process live in one heap ordered by deadline and are served by a single task,
+instead of a sleeping task per player. A room has at most one pending timer: scheduling a new one
+replaces the previous, and a timer fires once for the whole room.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from bson.objectid import ObjectId
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseScheduler:
+    def __init__(self):
+        self._heap: list[tuple[float, int, str]] = []
+        """Entries ``(deadline, seq, str(room_db_id))``. Cancelled and replaced entries are dropped lazily."""
+        self._timers: dict[str, tuple[int, Callable[[], Awaitable]]] = {}
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+        self._firing: set[asyncio.Task] = set()
+
+    def __len__(self):
+        """Number of pending timers."""
+        return len(self._timers)
+
+    def __contains__(self, room_db_id: ObjectId):
+        return str(room_db_id) in self._timers
+
+    def schedule(self, room_db_id: ObjectId, deadline: float, callback: Callable[[], Awaitable]):
+        """Await `callback` at `deadline` (unix time), replacing the pending timer of the room if there is one."""
+        key = str(room_db_id)
+        seq = next(self._counter)
+        self._timers[key] = (seq, callback)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        self._changed.set()
+
+    def cancel(self, room_db_id: ObjectId) -> bool:
+        """Drop the pending timer of the room. Return False if there is none."""
+        return self._timers.pop(str(room_db_id), None) is not None
+
+    async def run(self):
+        """Fire timers as their deadlines come. Runs until cancelled."""
+        while True:
+            self._changed.clear()
+            delay = self._next_delay()
+            if delay is None or delay > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                continue
+            _, _, key = heapq.heappop(self._heap)
+            _, callback = self._timers.pop(key)
+            task = asyncio.create_task(self._fire(key, callback))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+
+    def _next_delay(self) -> float | None:
+        while self._heap:
+            deadline, seq, key = self._heap[0]
+            timer = self._timers.get(key)
+            if timer is not None and timer[0] == seq:
+                return deadline - time.time()
+            heapq.heappop(self._heap)
+        return None
+
+    @staticmethod
+    async def _fire(key: str, callback: Callable[[], Awaitable]):
+        try:
+            await callback()
+        except Exception:
+            logger.exception("Timer of room %s failed", key)
+
+
+scheduler = PhaseScheduler()
@@ -15,6 +15,21 @@ class RoomState(Enum):
     ENDED = "ended"
 
 
+class GamePhase(Enum):
+    NIGHT = "night"
+    CHECKS = "checks"
+    END_OF_NIGHT = "end_of_night"
+    DAY = "day"
+
+
+class EventKind(Enum):
+    PHASE = "phase"
+    SHOT = "shot"
+    CHECK = "check"
+    DEATH = "death"
+    LAST_WORDS = "last_words"
+
+
 class PlayerRole(Enum):
     MAFIA = "mafia"
     DON = "don"
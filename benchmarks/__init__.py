@@ -0,0 +1,4 @@
+import os
+
+# the bot of ai_mafia.tg_proxy is created on import, benchmarks never let it reach Telegram
+os.environ.setdefault("TG_TOKEN", "1:bench")
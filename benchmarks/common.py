@@ -0,0 +1,111 @@
+"""
+Helpers shared by the benchmarks.
+
+Benchmarks are scripts, not tests: run them from the repository root, e.g. ``python -m benchmarks.recovery``.
+Parts that need MongoDB use the configured server with a ``_bench`` database and are skipped without one.
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+
+import uvicorn
+from fastapi import FastAPI
+from pymongo.errors import PyMongoError
+
+from ai_mafia.db import client, storage
+from ai_mafia.db.cache import room_cache
+from ai_mafia.db.matchmaking import matchmaker
+from ai_mafia.db.readiness import readiness
+
+_mongo_reachable: bool | None = None
+
+
+def mongo_reachable() -> bool:
+    """Whether the configured server answers. Switches the clients to the benchmark database on first call."""
+    global _mongo_reachable  # noqa: PLW0603
+    if _mongo_reachable is None:
+        client.config.name = f"{client.config.name}_bench"
+        client.config.server_selection_timeout_ms = 500
+        try:
+            client.get_client().admin.command("ping")
+            _mongo_reachable = True
+        except PyMongoError:
+            _mongo_reachable = False
+    return _mongo_reachable
+
+
+def use_storage(backend: str) -> bool:
+    """
+    Put an empty storage engine behind the routines and clear the room state of the process.
+    Return False if it is MongoDB and no server is reachable.
+    """
+    if backend == "mongo":
+        if not mongo_reachable():
+            print("MongoDB server is not reachable, skipped")
+            return False
+        client.get_client().drop_database(client.config.name)
+        # asyncio clients are bound to the loop of the run that created them
+        client._clients.pop(client.AsyncMongoClient, None)
+    storage.config.backend = backend
+    storage._storage = None
+    room_cache.clear()
+    matchmaker.clear()
+    readiness._futures.clear()
+    return True
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[round(q * (len(ordered) - 1))]
+
+
+def summary(samples: list[float], unit: str = "ms") -> str:
+    return (
+        f"median {statistics.median(samples):.2f} {unit}, p95 {percentile(samples, 0.95):.2f} {unit}, "
+        f"n={len(samples)}"
+    )
+
+
+class Stopwatch:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.elapsed = time.perf_counter() - self.start
+
+
+@asynccontextmanager
+async def serve(app: FastAPI, port: int = 0) -> AsyncIterator[int]:
+    """Run `app` on a local port, a free one by default, and yield the port."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:  # noqa: ASYNC110 uvicorn has no event for it
+        await asyncio.sleep(0.01)
+    try:
+        yield server.servers[0].sockets[0].getsockname()[1]
+    finally:
+        server.should_exit = True
+        await serving
+
+
+@contextmanager
+def serve_in_thread(app: FastAPI) -> Iterator[int]:
+    """
+    Same as :py:func:`serve`, but in a thread with its own loop, as if in another process.
+    Blocking clients in the benchmark's loop can reach it.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield server.servers[0].sockets[0].getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join()
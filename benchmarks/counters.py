@@ -0,0 +1,62 @@
+"""
+Latency of the user counter routines against MongoDB, before and after they were rebuilt on
+``find_one_and_update(..., return_document=AFTER)`` with projections. Needs a reachable server.
+"""
+
+import argparse
+import asyncio
+import time
+
+from bson.objectid import ObjectId
+
+from ai_mafia.db import async_routines
+from ai_mafia.db.storage.mongo import users_collection
+
+from .common import summary, use_storage
+
+
+async def increment_counter_before(db_id: ObjectId) -> int:
+    """The update and then a read of the whole document, as it was done before."""
+    await users_collection().update_one({"_id": db_id}, {"$inc": {"win_counter": 1}})
+    result = await users_collection().find_one({"_id": db_id})
+    return result["win_counter"]
+
+
+async def get_counter_before(db_id: ObjectId) -> int:
+    result = await users_collection().find_one({"_id": db_id})
+    return result["win_counter"]
+
+
+async def timed(routine, db_id: ObjectId, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await routine(db_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def run(repeat: int):
+    user = await async_routines.add_user(1, "player")
+    runs = [
+        ("increment_counter, update_one + find_one", increment_counter_before),
+        ("increment_counter, find_one_and_update", async_routines.increment_counter),
+        ("get_counter, whole document", get_counter_before),
+        ("get_counter, projection", async_routines.get_counter),
+    ]
+    for name, routine in runs:
+        await timed(routine, user.db_id, 50)  # warm up the pool
+        print(f"{name}: {summary(await timed(routine, user.db_id, repeat))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    if not use_storage("mongo"):
+        return
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
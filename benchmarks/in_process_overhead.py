@@ -0,0 +1,85 @@
+"""
+Per-message overhead of the two topologies: tg_proxy forwarding an update to the script's ``/chat``
+and the script handing it to itself with :py:func:`process_update` (``chatsky.in_process``).
+
+The pipeline turn is replaced by a stub that returns a fixed reply at once, so only the transport is timed:
+the conversion of the update, the HTTP hop and the JSON of the update and of the reply.
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import time
+from types import SimpleNamespace
+
+import telegram as tg
+from chatsky import Message
+
+from ai_mafia.http_client import close_http_client
+from ai_mafia.tg_proxy import bot_app, process_update
+
+from .common import serve, summary
+
+# the package exports the FastAPI app under the name of the module
+chatsky_web_api = importlib.import_module("ai_mafia.tg_proxy.chatsky_web_api")
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+REPLY = Message(text="Ваш ход")
+
+
+async def turn(message: Message, _ctx_id):
+    if not isinstance(message.original_message, tg.Update):
+        msg = "The script got the update in an unexpected form"
+        raise TypeError(msg)
+    return SimpleNamespace(last_response=REPLY)
+
+
+def make_update(i: int, bot: tg.Bot) -> tg.Update:
+    """A click on one of the buttons of a message, which is most of the traffic during a game."""
+    user = {"id": 5, "is_bot": False, "first_name": "player"}
+    keyboard = {"inline_keyboard": [[{"text": str(k), "callback_data": str(k)} for k in range(1, 11)]]}
+    message = {
+        "message_id": i,
+        "date": 0,
+        "text": "Ночь",
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+        "reply_markup": keyboard,
+    }
+    callback_query = {"id": str(i), "data": "3", "chat_instance": "chat", "from": user, "message": message}
+    return tg.Update.de_json({"update_id": i, "callback_query": callback_query}, bot)
+
+
+async def timed(forward, bot: tg.Bot, n_messages: int) -> list[float]:
+    for i in range(50):  # warm up
+        await forward(make_update(i, bot))
+    samples = []
+    for i in range(n_messages):
+        update = make_update(i, bot)
+        start = time.perf_counter()
+        await forward(update)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+async def run(n_messages: int):
+    chatsky_web_api.interface.on_request_async = turn
+    bot = tg.Bot("1:bench")
+    async with serve(chatsky_web_api.app) as port:
+        bot_app.config.host, bot_app.config.port = "127.0.0.1", port
+        print(f"tg_proxy -> /chat: {summary(await timed(bot_app.forward_over_http, bot, n_messages), 'us')}")
+        print(f"in process: {summary(await timed(process_update, bot, n_messages), 'us')}")
+    await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages))
+
+
+if __name__ == "__main__":
+    main()
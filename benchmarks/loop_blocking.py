@@ -0,0 +1,89 @@
+"""
+How long the event loop is blocked while 50 rooms play at once, with the blocking pymongo routines
+that the script used to call from its async handlers and with the asyncio routines it calls now.
+
+A probe task asks to be woken up every millisecond. Whatever it oversleeps by, the loop was busy
+with something that did not yield, e.g. waiting for a database reply. CPU work counts too, which is
+all the in-memory engine does, so its line is the floor the MongoDB lines can be compared with.
+"""
+
+import argparse
+import asyncio
+import time
+from types import ModuleType
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db import async_routines, routines
+from ai_mafia.types import PlayerState
+
+from .common import Stopwatch, use_storage
+
+PROBE_INTERVAL = 0.001
+
+
+class LoopProbe:
+    def __init__(self):
+        self.stalls: list[float] = []
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            self.stalls.append(max(0.0, time.perf_counter() - start - PROBE_INTERVAL))
+
+
+def awaitable(db_routines: ModuleType):
+    """Call the routines the way handlers do: awaiting the asyncio ones, calling the blocking ones directly."""
+
+    async def call(name: str, *args):
+        result = getattr(db_routines, name)(*args)
+        return await result if asyncio.iscoroutine(result) else result
+
+    return call
+
+
+async def play_room(call, room_no: int):
+    """Every request a room makes from seating its players to the first night's shots."""
+    room = await call("add_room", f"room{room_no}")
+    users = [await call("add_user", room_no * MAX_PLAYERS + i, "player") for i in range(MAX_PLAYERS)]
+    # players of a room click independently of each other
+    await asyncio.gather(*(call("join_room", user.db_id, room.db_id, user.tg_id, user.tg_id) for user in users))
+    await asyncio.gather(*(call("set_player_state", user.db_id, room.db_id, PlayerState.READY) for user in users))
+    await call("start_game", room.db_id)
+    await asyncio.gather(*(call("find_game_room", room.room_id) for _ in users))
+    await asyncio.gather(*(call("shoot", room.db_id, 1) for _ in users))
+
+
+async def measure(db_routines: ModuleType, n_rooms: int) -> tuple[float, LoopProbe]:
+    probe = LoopProbe()
+    probing = asyncio.create_task(probe.run())
+    call = awaitable(db_routines)
+    with Stopwatch() as stopwatch:
+        await asyncio.gather(*(play_room(call, i) for i in range(n_rooms)))
+    probing.cancel()
+    return stopwatch.elapsed, probe
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rooms", type=int, default=50)
+    args = parser.parse_args()
+
+    runs = [
+        ("routines, blocking pymongo", routines, "mongo"),
+        ("async_routines, MongoDB", async_routines, "mongo"),
+        ("async_routines, in-memory engine", async_routines, "memory"),
+    ]
+    for name, db_routines, backend in runs:
+        print(f"{name}:")
+        if not use_storage(backend):
+            continue
+        elapsed, probe = asyncio.run(measure(db_routines, args.rooms))
+        print(
+            f"  {args.rooms} rooms in {elapsed * 1000:.0f} ms, loop blocked for {sum(probe.stalls) * 1000:.0f} ms "
+            f"in total, longest stall {max(probe.stalls, default=0) * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Cost of turning one stored 10-player room into a :py:class:`RoomModel`.
+
+Reads from MongoDB validate the document with ``RoomModel(**doc)``. The candidates for a trusted,
+validation-free read path are timed next to it: ``model_construct`` with the enums converted by hand,
+and the same over a lazily decoded ``RawBSONDocument``. The in-memory engine copies every room it
+returns, so its copy is timed as it was, ``model_copy(deep=True)``, and as it is, re-validating a dump.
+"""
+
+import argparse
+import timeit
+
+from bson import encode
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db.models import PlayerModel, RoomModel
+from ai_mafia.db.queries import room_document
+from ai_mafia.db.storage.memory import _copy
+from ai_mafia.types import GamePhase, PlayerRole, PlayerState, RoomState
+
+
+def stored_room() -> dict:
+    roles = PlayerRole.all_roles()
+    players = [
+        PlayerModel(user_id=str(ObjectId()), ctx_id=i, chat_id=i, role=roles[i], number=i + 1, state=PlayerState.ALIVE)
+        for i in range(MAX_PLAYERS)
+    ]
+    room = RoomModel(
+        room_id="room", name="room", room_state=RoomState.STARTED, phase=GamePhase.NIGHT, list_players=players
+    )
+    doc = room_document(room)
+    del doc["db_id"]
+    return {"_id": ObjectId(), **doc}
+
+
+def construct(doc) -> RoomModel:
+    """Trusted read: only the enums are converted, everything else is taken as stored."""
+    players = [
+        PlayerModel.model_construct(
+            user_id=player["user_id"],
+            role=None if player["role"] is None else PlayerRole(player["role"]),
+            state=PlayerState(player["state"]),
+            number=player["number"],
+            ctx_id=player["ctx_id"],
+            chat_id=player["chat_id"],
+            shoot_cnt=player["shoot_cnt"],
+        )
+        for player in doc["list_players"]
+    ]
+    return RoomModel.model_construct(
+        db_id=doc["_id"],
+        room_id=doc["room_id"],
+        name=doc["name"],
+        last_words=doc["last_words"],
+        room_state=RoomState(doc["room_state"]),
+        phase=None if doc["phase"] is None else GamePhase(doc["phase"]),
+        deadline=doc["deadline"],
+        pending_signal=doc["pending_signal"],
+        settled=doc["settled"],
+        last_activity_at=doc["last_activity_at"],
+        version=doc["version"],
+        list_players=players,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    doc = stored_room()
+    raw = encode(doc)
+    room = RoomModel(**doc)
+    assert construct(doc) == room
+    # BSON keeps milliseconds of the date and drops its timezone
+    assert construct(RawBSONDocument(raw)).model_dump(exclude={"last_activity_at"}) == room.model_dump(
+        exclude={"last_activity_at"}
+    )
+
+    runs = [
+        ("MongoDB read, RoomModel(**doc)", lambda: RoomModel(**doc)),
+        ("MongoDB read, model_construct", lambda: construct(doc)),
+        ("MongoDB read, model_construct over RawBSONDocument", lambda: construct(RawBSONDocument(raw))),
+        ("in-memory copy before, model_copy(deep=True)", lambda: room.model_copy(deep=True)),
+        ("in-memory copy after, dump and validate", lambda: _copy(room)),
+    ]
+    for name, parse in runs:
+        seconds = min(timeit.repeat(parse, number=args.number, repeat=3))
+        print(f"{name}: {seconds / args.number * 1e6:.1f} us per room")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Time to recover 1,000 started games after a restart of the script process, on the in-memory engine.
+It covers reading the rooms and their players, rebuilding every player's context and resuming the timers.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+import mafia_script
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db import async_routines
+from ai_mafia.tg_proxy import scheduler
+from ai_mafia.types import PlayerState
+
+from .common import Stopwatch, use_storage
+
+
+async def seed(n_rooms: int):
+    """Started games, every other one with a pending phase timer."""
+    for room_no in range(n_rooms):
+        room = await async_routines.add_room(f"room{room_no}")
+        for i in range(MAX_PLAYERS):
+            tg_id = room_no * MAX_PLAYERS + i
+            user = await async_routines.add_user(tg_id, f"player{tg_id}")
+            await async_routines.join_room(user.db_id, room.db_id, tg_id, tg_id)
+            await async_routines.set_player_state(user.db_id, room.db_id, PlayerState.READY)
+        await async_routines.start_game(room.db_id)
+        if room_no % 2 == 0:
+            await async_routines.set_deadline(room.db_id, "_skip_", time.time() + 60)
+
+
+async def run(n_rooms: int, repeat: int):
+    await seed(n_rooms)
+    for _ in range(repeat):
+        mafia_script.pipeline.context_storage.clear()
+        with Stopwatch() as stopwatch, contextlib.redirect_stdout(io.StringIO()):
+            await mafia_script.recover_games()
+        print(
+            f"recovered {n_rooms} rooms in {stopwatch.elapsed * 1000:.0f} ms: "
+            f"{len(mafia_script.pipeline.context_storage)} contexts, {len(scheduler)} timers"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    use_storage("memory")
+    asyncio.run(run(args.rooms, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
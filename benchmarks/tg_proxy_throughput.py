@@ -0,0 +1,101 @@
+"""
+Updates per second that tg_proxy forwards to the script and answers, before and after it moved
+from a blocking ``requests.post`` per update to the shared pooled asyncio client.
+
+Both the script's ``/chat`` and the Bot API are local stand-ins. The script takes ``--script-ms``
+to answer, as a real turn would. The blocking forward is reproduced with ``urllib``, which like
+``requests.post`` opens a new connection per update and blocks the loop until the answer comes.
+"""
+
+import argparse
+import asyncio
+import urllib.request
+from types import SimpleNamespace
+
+import telegram as tg
+from chatsky import Message
+from fastapi import FastAPI
+
+from ai_mafia.http_client import close_http_client
+from ai_mafia.tg_proxy import bot_app, tg_update_to_chatsky_message
+from tests.test_outbox import FakeBotAPI
+
+from .common import Stopwatch, serve_in_thread
+
+
+def script_stand_in(latency: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def respond(user_message: Message):
+        await asyncio.sleep(latency)
+        return Message(text=f"got {user_message.text}")
+
+    return app
+
+
+async def forward_blocking(update: tg.Update) -> Message:
+    msg = tg_update_to_chatsky_message(update).model_dump_json().encode()
+    request = urllib.request.Request(
+        bot_app.config.make_endpoint("chat"), data=msg, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:  # noqa: ASYNC210 the point of the comparison
+        return Message.model_validate_json(response.read())
+
+
+def make_update(i: int, bot: tg.Bot) -> tg.Update:
+    user = {"id": i, "is_bot": False, "first_name": "player"}
+    message = {"message_id": i, "date": 0, "text": f"update {i}", "chat": {"id": i, "type": "private"}, "from": user}
+    return tg.Update.de_json({"update_id": i, "message": message}, bot)
+
+
+async def throughput(forward, bot: tg.Bot, n_updates: int, concurrency: int) -> float:
+    """Updates per second handled by `concurrency` handlers at once, like PTB with ``concurrent_updates``."""
+    updates = asyncio.Queue()
+    for i in range(n_updates):
+        updates.put_nowait(make_update(i, bot))
+    context = SimpleNamespace(bot=bot)
+
+    async def worker():
+        while not updates.empty():
+            await bot_app.handle_message(updates.get_nowait(), context, forward=forward)
+
+    with Stopwatch() as stopwatch:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return n_updates / stopwatch.elapsed
+
+
+async def run(n_updates: int, script_latency: float):
+    bot_api = FakeBotAPI()
+    # the script runs in another process, or the blocking forward would wait for the loop it blocks
+    with serve_in_thread(script_stand_in(script_latency)) as port:
+        await measure(bot_api, port, n_updates)
+
+
+async def measure(bot_api: FakeBotAPI, port: int, n_updates: int):
+    async with (
+        bot_api.serve() as base_url,
+        tg.Bot("1:bench", base_url=base_url) as bot,
+    ):
+        bot_app.config.host, bot_app.config.port = "127.0.0.1", port
+        for concurrency in (1, 16):
+            for name, forward in [
+                ("blocking requests", forward_blocking),
+                ("shared client", bot_app.forward_over_http),
+            ]:
+                await throughput(forward, bot, 20, concurrency)  # warm up
+                rate = await throughput(forward, bot, n_updates, concurrency)
+                print(f"{name}, {concurrency} at once: {rate:.0f} updates/s")
+        await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--script-ms", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.updates, args.script_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
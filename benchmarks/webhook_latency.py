@@ -0,0 +1,134 @@
+"""
+Latency of tg_proxy from an update becoming available to its arrival at the script's ``/chat``,
+with long polling and with the webhook. The Bot API and ``/chat`` are local stand-ins.
+
+In polling mode the clock starts when the stand-in has the update for the next ``getUpdates``,
+in webhook mode when the stand-in starts posting it to ``/telegram``.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import urllib.parse
+
+import httpx
+from fastapi import FastAPI, Request
+from telegram.ext import ApplicationBuilder
+
+import tg_proxy
+from ai_mafia.tg_proxy import bot_app
+from tests.test_outbox import FakeBotAPI
+
+from .common import serve, summary
+
+WEBHOOK_SECRET = "bench"
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class PollableBotAPI(FakeBotAPI):
+    """:py:class:`FakeBotAPI` that also serves ``getUpdates`` from a queue, holding the request up to its timeout."""
+
+    def __init__(self):
+        super().__init__()
+        self.updates: asyncio.Queue[dict] = asyncio.Queue()
+
+    async def handle(self, method: str, request: Request):
+        if method == "deleteWebhook":
+            return {"ok": True, "result": True}
+        if method != "getUpdates":
+            return await super().handle(method, request)
+        body = await request.body()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = dict(urllib.parse.parse_qsl(body.decode()))
+        try:
+            update = await asyncio.wait_for(self.updates.get(), timeout=float(data.get("timeout") or 0.01))
+        except asyncio.TimeoutError:
+            return {"ok": True, "result": []}
+        return {"ok": True, "result": [update]}
+
+
+class ScriptStandIn:
+    """``/chat`` that records when every update arrives."""
+
+    def __init__(self):
+        self.arrived: dict[str, asyncio.Future[float]] = {}
+        self.app = FastAPI()
+        self.app.post("/chat")(self.respond)
+
+    async def respond(self, request: Request):
+        text = (await request.json())["text"]
+        self.arrived[text].set_result(time.perf_counter())
+        return {"text": "ok"}
+
+    def expect(self, text: str) -> asyncio.Future[float]:
+        self.arrived[text] = asyncio.get_running_loop().create_future()
+        return self.arrived[text]
+
+
+def make_update(i: int) -> dict:
+    user = {"id": i, "is_bot": False, "first_name": "player"}
+    message = {"message_id": i, "date": 0, "text": f"update {i}", "chat": {"id": i, "type": "private"}, "from": user}
+    return {"update_id": i, "message": message}
+
+
+async def polling(bot_api: PollableBotAPI, script: ScriptStandIn, n_updates: int) -> list[float]:
+    application = bot_app.build_application()
+    latencies = []
+    async with application:
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        await application.start()
+        for i in range(n_updates):
+            arrived = script.expect(f"update {i}")
+            start = time.perf_counter()
+            bot_api.updates.put_nowait(make_update(i))
+            latencies.append((await arrived - start) * 1000)
+        await application.updater.stop()
+        await application.stop()
+    return latencies
+
+
+async def webhook(script: ScriptStandIn, n_updates: int) -> list[float]:
+    latencies = []
+    async with tg_proxy.lifespan(tg_proxy.webhook_app), serve(tg_proxy.webhook_app) as port:
+        url = f"http://127.0.0.1:{port}{tg_proxy.WEBHOOK_PATH}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+        async with httpx.AsyncClient() as telegram:
+            for i in range(n_updates):
+                arrived = script.expect(f"update {i}")
+                start = time.perf_counter()
+                await telegram.post(url, json=make_update(i), headers=headers)
+                latencies.append((await arrived - start) * 1000)
+    return latencies
+
+
+async def run(n_updates: int):
+    bot_api, script = PollableBotAPI(), ScriptStandIn()
+    async with bot_api.serve() as base_url, serve(script.app) as script_port:
+        bot_app.config.host, bot_app.config.port = "127.0.0.1", script_port
+
+        class LocalApplicationBuilder(ApplicationBuilder):
+            def build(self):
+                self.base_url(base_url)
+                return super().build()
+
+        bot_app.ApplicationBuilder = LocalApplicationBuilder
+        os.environ["TG_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+        print(f"polling: {summary(await polling(bot_api, script, n_updates))}")
+        print(f"webhook: {summary(await webhook(script, n_updates))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.updates))
+
+
+if __name__ == "__main__":
+    main()
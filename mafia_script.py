@@ -1,3 +1,4 @@
+import asyncio
 import json
 from typing import TYPE_CHECKING
 
@@ -25,23 +26,41 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 from ai_mafia.config import load_config
 from ai_mafia.constants import N_PLAYERS, NUM_PLAYERS
-from ai_mafia.db.models import RoomModel
-from ai_mafia.db.routines import (
+from ai_mafia.db.async_routines import (
     add_room,
     add_user,
+    claim_phase,
     exit_room,
     find_game_room,
+    find_open_room,
+    find_recoverable_rooms,
     find_user,
-    get_random_room,
+    find_users,
     join_room,
     murder,
+    room_snapshot,
     set_player_state,
+    settle_game,
     shoot,
     start_game,
     update_last_words,
 )
-from ai_mafia.tg_proxy import chatsky_web_api, chatsky_web_interface, send_message_to_others, send_signal
-from ai_mafia.types import PlayerRole, PlayerState, RoomState
+from ai_mafia.db.client import get_database
+from ai_mafia.db.events import event_log
+from ai_mafia.db.models import RoomModel
+from ai_mafia.db.setup import ensure_indexes
+from ai_mafia.tg_proxy import (
+    chatsky_web_api,
+    chatsky_web_interface,
+    notify_room,
+    resume_timer,
+    send_message_to_others,
+    send_signal,
+    serve_with_script,
+    start_timer,
+    startup_hooks,
+)
+from ai_mafia.types import EventKind, GamePhase, PlayerRole, PlayerState, RoomState
 
 if TYPE_CHECKING:
     import telegram as tg
@@ -58,6 +77,12 @@ Id: {room.room_id}
 Число участников: {len(room.list_players)}/10"""
 
 
+def game_result_string(room: RoomModel):
+    if room.is_black_win():
+        return "Игра окончена: победила мафия"
+    return "Игра окончена: победили мирные жители"
+
+
 class FallbackResponse(BaseResponse):
     async def call(self, ctx: Context):
         txt = ctx.last_request.text
@@ -78,9 +103,9 @@ class InitSessionProcessing(BaseProcessing):
         tg_info: tg.Update = ctx.last_request.original_message
         tg_id = tg_info.effective_user.id
         user_nickname = tg_info.effective_user.name
-        user_info = find_user(tg_id)
+        user_info = await find_user(tg_id)
         if user_info is None:
-            user_info = add_user(tg_id, user_nickname)
+            user_info = await add_user(tg_id, user_nickname)
         ctx.misc["user_info"] = user_info
         ctx.misc["chat_id"] = tg_info.effective_chat.id
 
@@ -156,7 +181,7 @@ class CreateRoomResponse(BaseResponse):
 class NewRoomResponse(BaseResponse):
     async def call(self, ctx: Context) -> MessageInitTypes:
         name = ctx.last_request.text
-        room = add_room(name)
+        room = await add_room(name)
         ctx.misc["room_info"] = room
 
         keyboard = InlineKeyboardMarkup(
@@ -238,7 +263,11 @@ class RandomNotFoundResponse(BaseResponse):
 
 
 class AreYouReadyResponse(BaseResponse):
-    async def call(self, _: Context):
+    async def call(self, ctx: Context):
+        if ctx.misc["room_info"] is None:
+            keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="leave")]])
+            return Message(text="К сожалению, в комнате не осталось свободных мест", reply_markup=keyboard)
+
         keyboard = InlineKeyboardMarkup(
             [
                 [InlineKeyboardButton("📝 Правила игры", callback_data="get_rules")],
@@ -268,7 +297,7 @@ class WaitingStartResponse(BaseResponse):
 
 class RandomRoomCreatedCondition(BaseCondition):
     async def call(self, ctx: Context) -> MessageInitTypes:
-        room = get_random_room()
+        room = await find_open_room()
         if room is not None and room.room_state == RoomState.CREATED:
             ctx.misc["room_info"] = room
             return True
@@ -277,7 +306,7 @@ class RandomRoomCreatedCondition(BaseCondition):
 
 class RoomCreatedCondition(BaseCondition):
     async def call(self, ctx: Context) -> MessageInitTypes:
-        room = find_game_room(ctx.last_request.text)
+        room = await find_game_room(ctx.last_request.text)
         if room is not None and room.room_state == RoomState.CREATED:
             ctx.misc["room_info"] = room
             return True
@@ -301,7 +330,8 @@ class JoinRoomProcessing(BaseProcessing):
         user_info: UserModel = ctx.misc["user_info"]
         room_info: RoomModel = ctx.misc["room_info"]
         if room_info.get_player(str(user_info.db_id)) is None:
-            join_room(user_info.db_id, room_info.db_id, ctx.id, ctx.misc["chat_id"])
+            # None if somebody has taken the last seat since the room was shown to the user
+            ctx.misc["room_info"] = await join_room(user_info.db_id, room_info.db_id, ctx.id, ctx.misc["chat_id"])
 
 
 class ExitRoomProcessing(BaseProcessing):
@@ -311,8 +341,9 @@ class ExitRoomProcessing(BaseProcessing):
         upd: tg.Update | None = ctx.last_request.original_message
         if upd is not None and upd.callback_query.data == "leave":
             user_info: UserModel = ctx.misc["user_info"]
-            room_info: RoomModel = ctx.misc["room_info"]
-            exit_room(user_info.db_id, room_info.db_id)
+            room_info: RoomModel | None = ctx.misc["room_info"]
+            if room_info is not None:
+                await exit_room(user_info.db_id, room_info.db_id)
             ctx.misc["room_info"] = None
 
 
@@ -322,17 +353,16 @@ class NotReadyProcessing(BaseProcessing):
         if upd is not None and upd.callback_query.data == "not_ready":
             user_info: UserModel = ctx.misc["user_info"]
             room_info: RoomModel = ctx.misc["room_info"]
-            set_player_state(user_info.db_id, room_info.db_id, PlayerState.NOT_READY)
-            ctx.misc["room_info"] = find_game_room(room_info.room_id)
+            ctx.misc["room_info"] = await set_player_state(user_info.db_id, room_info.db_id, PlayerState.NOT_READY)
 
 
 class CheckReadyProcessing(ModifyResponse):
     async def modified_response(self, original_response: BaseResponse, ctx: Context):
         user_info: UserModel = ctx.misc["user_info"]
         room_info: RoomModel = ctx.misc["room_info"]
-        room = set_player_state(user_info.db_id, room_info.db_id, PlayerState.READY)
+        room = await set_player_state(user_info.db_id, room_info.db_id, PlayerState.READY)
         if room.is_room_ready(N_PLAYERS):
-            send_signal(find_game_room(room_info.room_id), "_ready_")
+            send_signal(room, "_ready_")
             return "Мы вас ждали!"
         return await original_response(ctx)
 
@@ -341,19 +371,16 @@ class StartGameProcessing(ModifyResponse):
     """Implement game starting logic"""
 
     async def modified_response(self, original_response: BaseResponse, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
-        if ctx.id == room.list_players[0].ctx_id:
-            start_game(room.db_id)
-            send_signal(find_game_room(room_info.room_id))
+        room = await room_snapshot(ctx)
+        if await start_game(room.db_id):
+            await start_timer(await room_snapshot(ctx))
         return await original_response(ctx)
 
 
 class StartGameResponse(BaseResponse):
     async def call(self, ctx: Context) -> MessageInitTypes:
         user_info: UserModel = ctx.misc["user_info"]
-        room_info: RoomModel = ctx.misc["room_info"]
-        room: RoomModel = find_game_room(room_info.room_id)
+        room: RoomModel = await room_snapshot(ctx)
         ctx.misc["room_info"] = room
         player_info: PlayerModel = room.get_player(str(user_info.db_id))
         return f"""Игра началась!
@@ -370,8 +397,9 @@ class ShootingResponse(BaseResponse):
         user_info: UserModel = ctx.misc["user_info"]
         room_info: RoomModel = ctx.misc["room_info"]
         player_info: PlayerModel = room_info.get_player(str(user_info.db_id))
-        if ctx.id == room_info.list_players[0].ctx_id:
-            send_signal(find_game_room(room_info.room_id), timer=10)
+        room = await claim_phase(await room_snapshot(ctx), GamePhase.NIGHT)
+        if room is not None:
+            await start_timer(room, timer=10)
         if player_info.role.is_black() and player_info.state == PlayerState.ALIVE:
             return "Наступает ночь! Напишите номер игрока, в которого будете стрелять. У вас 10 секунд"
         return "Наступает ночь! Мафия выбирает, кого убить"
@@ -386,7 +414,8 @@ class ShootingProcessing(BaseProcessing):
         player_info: PlayerModel = room_info.get_player(str(user_info.db_id))
         request = ctx.last_request.text
         if player_info.role.is_black() and request in NUM_PLAYERS:
-            shoot(room_db_id=ctx.misc["room_info"].db_id, i=int(request) - 1)
+            await shoot(room_db_id=room_info.db_id, player_number=int(request))
+            event_log.append(room_info.room_id, EventKind.SHOT, actor=player_info.number, target=int(request))
 
 
 class ShootCondition(BaseCondition):
@@ -401,8 +430,9 @@ class CheckResponse(BaseResponse):
         user_info: UserModel = ctx.misc["user_info"]
         room_info: RoomModel = ctx.misc["room_info"]
         player_info: PlayerModel = room_info.get_player(str(user_info.db_id))
-        if ctx.id == room_info.list_players[0].ctx_id:
-            send_signal(find_game_room(room_info.room_id), timer=10)
+        room = await claim_phase(await room_snapshot(ctx), GamePhase.CHECKS)
+        if room is not None:
+            await start_timer(room, timer=10)
         if player_info.role == PlayerRole.COMMISSAR and player_info.state == PlayerState.ALIVE:
             return "Вы - комиссар. Напишите номер игрока, которого хотите проверить. У вас 10 секунд"
         if player_info.role == PlayerRole.DON and player_info.state == PlayerState.ALIVE:
@@ -426,11 +456,19 @@ class IsDon(BaseCondition):
         return player_info.role == PlayerRole.DON
 
 
+def log_check(ctx: Context, target: int):
+    user_info: UserModel = ctx.misc["user_info"]
+    room_info: RoomModel = ctx.misc["room_info"]
+    player_info: PlayerModel = room_info.get_player(str(user_info.db_id))
+    event_log.append(room_info.room_id, EventKind.CHECK, actor=player_info.number, target=target)
+
+
 class ComsCheckResponse(BaseResponse):
     async def call(self, ctx: Context):
         request = ctx.last_request.text
         if request in NUM_PLAYERS:
             num = int(request)
+            log_check(ctx, num)
             role: PlayerRole = ctx.misc["room_info"].list_players[num - 1].role
             color = "чёрный" if role.is_black() else "красный"
             return f"Этот игрок {color}"
@@ -442,6 +480,7 @@ class DonsCheckResponse(BaseResponse):
         request = ctx.last_request.text
         if request in NUM_PLAYERS:
             num = int(request)
+            log_check(ctx, num)
             role = ctx.misc["room_info"].list_players[num - 1].role
             is_com = "" if role == PlayerRole.COMMISSAR else "не "
             return f"Этот игрок {is_com}комиссар"
@@ -450,18 +489,23 @@ class DonsCheckResponse(BaseResponse):
 
 class EndNightProcessing(BaseProcessing):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        if ctx.id == room_info.list_players[0].ctx_id:
-            if murder(room_info.room_id):
-                send_signal(find_game_room(room_info.room_id), "_kill_")
-            else:
-                send_signal(find_game_room(room_info.room_id))
+        room = await claim_phase(await room_snapshot(ctx), GamePhase.END_OF_NIGHT)
+        if room is None:
+            return
+        killed = await murder(room.room_id)
+        # the murder may have decided the game: count it before anyone is told the result
+        ended_room = await settle_game(await room_snapshot(ctx))
+        if ended_room is not None:
+            notify_room(ended_room, game_result_string(ended_room))
+        elif killed:
+            await start_timer(await room_snapshot(ctx), "_kill_")
+        else:
+            await start_timer(await room_snapshot(ctx))
 
 
 class EndNightResponse(BaseResponse):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
+        room = await room_snapshot(ctx)
         pre_dead_player: PlayerModel = room.get_pre_dead_player()
         if pre_dead_player is None:
             return "В эту ночь мафия никого не убила"
@@ -470,18 +514,16 @@ class EndNightResponse(BaseResponse):
 
 class DeadSpeechProcessing(BaseProcessing):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
+        room = await room_snapshot(ctx)
         player: PlayerModel = room.get_pre_dead_player()
         if ctx.id == player.ctx_id:
-            update_last_words(room.room_id, ctx.last_request.text)
-            send_signal(room=room, timer=10)
+            await update_last_words(room.room_id, ctx.last_request.text)
+            await start_timer(room, timer=10)
 
 
 class DeadSpeechResponse(BaseResponse):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
+        room = await room_snapshot(ctx)
         player: PlayerModel = room.get_pre_dead_player()
 
         if ctx.id == player.ctx_id:
@@ -493,8 +535,7 @@ class DeadSpeechResponse(BaseResponse):
 
 class AreYouPreDeadCondition(BaseCondition):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
+        room = await room_snapshot(ctx)
         player: PlayerModel = room.get_pre_dead_player()
 
         return ctx.id == player.ctx_id
@@ -502,8 +543,7 @@ class AreYouPreDeadCondition(BaseCondition):
 
 class ReadDeadSpeechResponse(BaseResponse):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
+        room = await room_snapshot(ctx)
         player: PlayerModel = room.get_pre_dead_player()
 
         return f"У игрока {player.number} есть прощальная минута."
@@ -511,18 +551,21 @@ class ReadDeadSpeechResponse(BaseResponse):
 
 class LastWordsProcessing(BaseProcessing):
     async def call(self, ctx: Context):
+        text = ctx.last_request.text
+        # the end of the speech: the timer signal or the button, neither is part of the speech
+        if text is None or text == "_skip_":
+            return
         room_info: RoomModel = ctx.misc["room_info"]
         user_info: UserModel = ctx.misc["user_info"]
-        update_last_words(room_info.room_id, ctx.last_request.text)
+        await update_last_words(room_info.room_id, text)
 
-        room = find_game_room(room_info.room_id)
-        send_message_to_others(room=room, user_id=str(user_info.db_id), msg="_speech_")
+        room = await room_snapshot(ctx)
+        await send_message_to_others(room=room, user_id=str(user_info.db_id), msg="_speech_")
 
 
 class ReadLastWordsResponse(BaseResponse):
     async def call(self, ctx: Context):
-        room_info: RoomModel = ctx.misc["room_info"]
-        room = find_game_room(room_info.room_id)
+        room = await room_snapshot(ctx)
         return room.last_words
 
 
@@ -814,12 +857,62 @@ pipeline = Pipeline(
     messenger_interface=chatsky_web_interface,
 )
 
+PHASE_NODES = {
+    None: "start_node",
+    GamePhase.NIGHT: "shooting_phase",
+    GamePhase.CHECKS: "checks_phase",
+    GamePhase.END_OF_NIGHT: "end_of_night",
+    GamePhase.DAY: "day",
+}
+"""Node of ``in_game_flow`` where players wait for the signal that ends the phase."""
+
+
+async def recover_games():
+    """
+    Bring back games interrupted by a restart of this process.
+
+    Contexts of players are kept in memory, so they are rebuilt at the node of the phase persisted in the room.
+    Pending phase timers are resumed, the overdue ones fire right away.
+
+    A context belongs to a user, not to a game, so every user gets back only the newest of their games.
+    Older games that share a player with it are abandoned and left alone.
+    """
+    rooms = await find_recoverable_rooms()
+    if not rooms:
+        return
+    tg_ids = [player.ctx_id for room in rooms for player in room.list_players]
+    users = {user.tg_id: user for user in await find_users(tg_ids)}
+    claimed: set[int] = set()
+    recovered = 0
+    for room in rooms:  # the most recently active first
+        if any(player.ctx_id in claimed for player in room.list_players):
+            continue
+        claimed.update(player.ctx_id for player in room.list_players)
+        players = [player for player in room.list_players if player.ctx_id in users]
+        for player in players:
+            ctx = Context.init(("in_game_flow", PHASE_NODES[room.phase]), id=player.ctx_id)
+            ctx.misc.update(user_info=users[player.ctx_id], room_info=room, chat_id=player.chat_id)
+            pipeline.context_storage[player.ctx_id] = ctx
+        notify_room(room, "Сервер был перезапущен, игра продолжается", players)
+        if room.pending_signal is not None:
+            resume_timer(room, room.pending_signal, room.deadline)
+        recovered += 1
+    print(f"Recovered {recovered} games")
+
+
+startup_hooks.append(recover_games)
+
 config = load_config().chatsky
 
 if __name__ == "__main__":
+    if load_config().db.backend == "mongo":
+        ensure_indexes(get_database())
     pipeline.run()
-    uvicorn.run(
-        chatsky_web_api,
-        host=config.host,
-        port=config.port,
-    )
+    if config.in_process:
+        asyncio.run(serve_with_script(chatsky_web_api, config.host, config.port))
+    else:
+        uvicorn.run(
+            chatsky_web_api,
+            host=config.host,
+            port=config.port,
+        )
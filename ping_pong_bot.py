@@ -11,7 +11,7 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 
 from ai_mafia.config import load_config
-from ai_mafia.db.routines import add_user, find_user, increment_counter
+from ai_mafia.db.async_routines import add_user, find_user, increment_counter
 
 if TYPE_CHECKING:
     from ai_mafia.db.models import UserModel
@@ -30,9 +30,9 @@ class InitSessionProcessing(BaseProcessing):
         tg_info: tg.Update = ctx.last_request.original_message
         tg_id = tg_info.effective_user.id
         user_nickname = tg_info.effective_user.name
-        user_info = find_user(tg_id)
+        user_info = await find_user(tg_id)
         if user_info is None:
-            user_info = add_user(tg_id, user_nickname)
+            user_info = await add_user(tg_id, user_nickname)
         ctx.misc["user_info"] = user_info
 
 
@@ -56,7 +56,7 @@ class PongResponse(BaseResponse):
 
     async def call(self, ctx: Context):
         user_info: UserModel = ctx.misc["user_info"]
-        up_to_date_counter = increment_counter(user_info.db_id)
+        up_to_date_counter = await increment_counter(user_info.db_id)
         user_info.ping_counter = up_to_date_counter
         return f"Pong, {user_info.tg_nickname}! Total counter is {user_info.ping_counter}"
 
@@ -2,6 +2,8 @@ import uvicorn
 from fastapi import FastAPI
 
 from ai_mafia.config import load_config
+from ai_mafia.db.client import get_database
+from ai_mafia.db.setup import ensure_indexes
 from ai_mafia.sync import synchronizer_app
 
 app = FastAPI()
@@ -9,4 +11,6 @@ app = FastAPI()
 config = load_config().sync
 
 if __name__ == "__main__":
+    if load_config().db.backend == "mongo":
+        ensure_indexes(get_database())
     uvicorn.run(synchronizer_app, host=config.host, port=config.port)
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from ai_mafia.db import client, storage
+from ai_mafia.db.cache import room_cache
+from ai_mafia.db.matchmaking import matchmaker
+from ai_mafia.db.readiness import readiness
+
+# the bot of ai_mafia.tg_proxy is created on import, tests never let it reach Telegram
+os.environ.setdefault("TG_TOKEN", "1:test")
+
+
+def _reset_room_state():
+    room_cache.clear()
+    matchmaker.clear()
+    readiness._futures.clear()
+
+
+@pytest.fixture
+def memory_storage(monkeypatch):
+    """Fresh in-memory storage engine behind the async routines, with empty process-wide room state."""
+    monkeypatch.setattr(storage.config, "backend", "memory")
+    monkeypatch.setattr(storage, "_storage", None)
+    _reset_room_state()
+    yield storage.get_storage()
+    _reset_room_state()
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def any_storage(request, monkeypatch):
+    """
+    Every storage engine in turn, for tests of atomicity. The in-memory engine never yields between
+    reading and writing a room, so only MongoDB can show a lost update. Skipped for it if no server is reachable.
+    """
+    if request.param == "mongo":
+        request.getfixturevalue("mongo_database")
+    monkeypatch.setattr(storage.config, "backend", request.param)
+    monkeypatch.setattr(storage, "_storage", None)
+    _reset_room_state()
+    yield storage.get_storage()
+    _reset_room_state()
+
+
+_mongo_reachable: bool | None = None
+"""Whether the server answered the first ping. Pinging an absent server takes a timeout, so it is done once."""
+
+
+@pytest.fixture
+def mongo_database(monkeypatch):
+    """Empty database on the configured MongoDB server. The test is skipped if no server is reachable."""
+    monkeypatch.setattr(client.config, "name", f"{client.config.name}_test")
+    monkeypatch.setattr(client.config, "server_selection_timeout_ms", 500)
+    client._clients.clear()
+    mongo_client = client.get_client()
+    global _mongo_reachable  # noqa: PLW0603
+    if _mongo_reachable is None:
+        try:
+            mongo_client.admin.command("ping")
+            _mongo_reachable = True
+        except PyMongoError:
+            _mongo_reachable = False
+    if not _mongo_reachable:
+        mongo_client.close()
+        client._clients.clear()
+        pytest.skip("MongoDB server is not reachable")
+    mongo_client.drop_database(client.config.name)
+    yield client.get_database()
+    mongo_client.drop_database(client.config.name)
+    mongo_client.close()
+    client._clients.clear()
@@ -0,0 +1,76 @@
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+from ai_mafia.db.models import PlayerModel, RoomModel
+
+# the package exports the FastAPI app under the name of the module
+chatsky_web_api = importlib.import_module("ai_mafia.tg_proxy.chatsky_web_api")
+
+N_ROOMS = 20
+N_PLAYERS = 10
+
+
+def make_room(i: int) -> RoomModel:
+    players = [PlayerModel(user_id=f"{i}-{j}", ctx_id=100 * i + j, chat_id=100 * i + j) for j in range(N_PLAYERS)]
+    return RoomModel(name="test", room_id=str(i), list_players=players)
+
+
+@pytest.fixture
+def script(monkeypatch):
+    """Stand-in for the script and the bot. Records the number of turns run at once."""
+    state = SimpleNamespace(running=0, max_running=0, failing=set(), on_turn=None)
+
+    async def on_request_async(message, ctx_id):
+        state.running += 1
+        state.max_running = max(state.max_running, state.running)
+        try:
+            await asyncio.sleep(0.001)
+            if ctx_id in state.failing:
+                raise RuntimeError
+            if state.on_turn is not None:
+                await state.on_turn(message, ctx_id)
+        finally:
+            state.running -= 1
+        return SimpleNamespace(last_response=SimpleNamespace(text="ok"))
+
+    async def send(_chat_id, text, _priority):
+        return text
+
+    monkeypatch.setattr(chatsky_web_api.interface, "on_request_async", on_request_async)
+    monkeypatch.setattr(chatsky_web_api.outbox, "send", send)
+    monkeypatch.setattr(chatsky_web_api, "_broadcast_turns", asyncio.Semaphore(4))
+    return state
+
+
+def test_concurrency_is_bounded_and_failures_reported(script):
+    rooms = [make_room(i) for i in range(N_ROOMS)]
+    script.failing = {rooms[0].list_players[3].ctx_id}
+
+    async def scenario():
+        return await asyncio.gather(*(chatsky_web_api.broadcast(room, "_skip_") for room in rooms))
+
+    failed = asyncio.run(scenario())
+    assert script.max_running == 4
+    assert [player.user_id for player in failed[0]] == ["0-3"]
+    assert all(not players for players in failed[1:])
+
+
+def test_nested_broadcast_does_not_deadlock(script):
+    rooms = {str(i): make_room(i) for i in range(N_ROOMS)}
+
+    async def relay(message, ctx_id):
+        # like the last words of a player relayed to the rest of the room from inside a broadcast turn
+        if message.text == "_skip_" and ctx_id % 100 == 0:
+            room = rooms[str(ctx_id // 100)]
+            await chatsky_web_api.send_message_to_others(room, room.list_players[0].user_id, "_speech_")
+
+    script.on_turn = relay
+
+    async def scenario():
+        broadcasts = (chatsky_web_api.broadcast(room, "_skip_") for room in rooms.values())
+        return await asyncio.wait_for(asyncio.gather(*broadcasts), timeout=5)
+
+    assert all(not players for players in asyncio.run(scenario()))
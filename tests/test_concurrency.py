@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db import async_routines
+from ai_mafia.types import PlayerState, RoomState
+
+
+async def seat_players(n_players: int):
+    room = await async_routines.add_room("test")
+    users = [await async_routines.add_user(tg_id, f"player{tg_id}") for tg_id in range(n_players)]
+    for user in users:
+        await async_routines.join_room(user.db_id, room.db_id, user.tg_id, user.tg_id)
+    return room, users
+
+
+def test_parallel_ready_and_shoot(any_storage):
+    async def scenario():
+        room, users = await seat_players(MAX_PLAYERS)
+
+        await asyncio.gather(
+            *(async_routines.set_player_state(user.db_id, room.db_id, PlayerState.READY) for user in users)
+        )
+        stored = await any_storage.rooms.find_by_db_id(room.db_id)
+        assert [player.state for player in stored.list_players] == [PlayerState.READY] * MAX_PLAYERS
+
+        assert await async_routines.start_game(room.db_id)
+        await asyncio.gather(*(async_routines.shoot(room.db_id, 1) for _ in users))
+        stored = await any_storage.rooms.find_by_db_id(room.db_id)
+        assert stored.room_state == RoomState.STARTED
+        shots = {player.number: player.shoot_cnt for player in stored.list_players}
+        assert shots == {number: MAX_PLAYERS if number == 1 else 0 for number in range(1, MAX_PLAYERS + 1)}
+        # every click is one write, none of them is lost
+        assert stored.version == 3 * MAX_PLAYERS + 1
+
+    asyncio.run(scenario())
+
+
+def test_parallel_ready_and_exit(any_storage):
+    async def scenario():
+        room, users = await seat_players(MAX_PLAYERS)
+        leaving, staying = users[::2], users[1::2]
+
+        await asyncio.gather(
+            *(async_routines.exit_room(user.db_id, room.db_id) for user in leaving),
+            *(async_routines.set_player_state(user.db_id, room.db_id, PlayerState.READY) for user in staying),
+        )
+        stored = await any_storage.rooms.find_by_db_id(room.db_id)
+        assert {player.user_id for player in stored.list_players} == {str(user.db_id) for user in staying}
+        assert all(player.state == PlayerState.READY for player in stored.list_players)
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("agreed", [True, False], ids=["killed", "missed"])
+def test_murder_matches_kill(any_storage, agreed):
+    """The server-side murder must give the same room as :py:meth:`RoomModel.kill` run on the client."""
+
+    async def scenario():
+        room, users = await seat_players(MAX_PLAYERS)
+        for user in users:
+            await async_routines.set_player_state(user.db_id, room.db_id, PlayerState.READY)
+        assert await async_routines.start_game(room.db_id)
+        started = await any_storage.rooms.find_by_db_id(room.db_id)
+        n_black = started.get_cnt_black()
+        targets = [1] * n_black if agreed else [1] * (n_black - 1) + [2]
+        await asyncio.gather(*(async_routines.shoot(room.db_id, target) for target in targets))
+
+        expected = await any_storage.rooms.find_by_db_id(room.db_id)
+        killed = expected.kill()
+        assert killed == agreed
+        assert await async_routines.murder(room.room_id) == killed
+        stored = await any_storage.rooms.find_by_db_id(room.db_id)
+        assert [(player.state, player.shoot_cnt) for player in stored.list_players] == [
+            (player.state, player.shoot_cnt) for player in expected.list_players
+        ]
+
+    asyncio.run(scenario())
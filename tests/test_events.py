@@ -0,0 +1,43 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect
+
+from ai_mafia.db.events import EventLog
+from ai_mafia.types import EventKind
+
+
+def test_seq_survives_restart(memory_storage):
+    async def scenario():
+        # every log stands for a process, or the same process after a restart
+        for _ in range(2):
+            event_log = EventLog(batch_size=100, flush_interval=1)
+            for actor in range(3):
+                event_log.append("room", EventKind.SHOT, actor=actor)
+                event_log.append("other room", EventKind.PHASE, text="night")
+            await event_log.flush()
+        events = await memory_storage.events.find_by_room("room")
+        assert [event.seq for event in events] == list(range(6))
+        assert [event.actor for event in events] == [0, 1, 2] * 2
+
+    asyncio.run(scenario())
+
+
+def test_failed_flush_is_retried(memory_storage, monkeypatch):
+    async def scenario():
+        event_log = EventLog(batch_size=100, flush_interval=1)
+        event_log.append("room", EventKind.PHASE, text="night")
+
+        async def fail(_):
+            raise AutoReconnect
+
+        with monkeypatch.context() as patch:
+            patch.setattr(memory_storage.events, "insert_many", fail)
+            await event_log.flush()
+        assert len(event_log) == 1
+
+        event_log.append("room", EventKind.PHASE, text="day")
+        await event_log.flush()
+        events = await memory_storage.events.find_by_room("room")
+        assert [(event.seq, event.text) for event in events] == [(0, "night"), (1, "day")]
+
+    asyncio.run(scenario())
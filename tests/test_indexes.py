@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+import pytest
+from bson.objectid import ObjectId
+
+from ai_mafia.db.queries import (
+    clear_deadline_query,
+    compare_and_set_query,
+    end_game_query,
+    ended_rooms_filter,
+    exit_room_query,
+    idle_rooms_filter,
+    join_room_query,
+    last_words_query,
+    murder_query,
+    random_room_pipeline,
+    recoverable_rooms_filter,
+    set_player_state_query,
+    shoot_query,
+)
+from ai_mafia.db.setup import ensure_indexes
+from ai_mafia.types import PlayerState
+
+ROOM_DB_ID = ObjectId()
+USER_DB_ID = ObjectId()
+NOW = datetime.now(timezone.utc)
+
+QUERIES = {
+    "find_user": ("users", {"tg_id": 1}),
+    "find_users": ("users", {"tg_id": {"$in": [1, 2]}}),
+    "get_counter": ("users", {"_id": USER_DB_ID}),
+    "find_game_room": ("game_rooms", {"room_id": "room"}),
+    "set_player_state": ("game_rooms", set_player_state_query(USER_DB_ID, ROOM_DB_ID, PlayerState.READY)[0]),
+    "join_room": ("game_rooms", join_room_query({"user_id": str(USER_DB_ID)}, ROOM_DB_ID)[0]),
+    "exit_room": ("game_rooms", exit_room_query(USER_DB_ID, ROOM_DB_ID)[0]),
+    "shoot": ("game_rooms", shoot_query(ROOM_DB_ID, 1)[0]),
+    "murder": ("game_rooms", murder_query("room")[0]),
+    "end_game": ("game_rooms", end_game_query(ROOM_DB_ID)[0]),
+    "update_last_words": ("game_rooms", last_words_query("room", "bye")[0]),
+    "clear_deadline": ("game_rooms", clear_deadline_query(ROOM_DB_ID, 1.0)[0]),
+    "compare_and_set": ("game_rooms", compare_and_set_query(ROOM_DB_ID, 0, {})[0]),
+    "rebuild_matchmaker": ("game_rooms", {"room_state": "created"}),
+    "find_recoverable_rooms": ("game_rooms", recoverable_rooms_filter(NOW)),
+    "expire_idle_rooms": ("game_rooms", idle_rooms_filter(NOW)),
+    "archive_ended_rooms": ("game_rooms", ended_rooms_filter(NOW)),
+    "find_events": ("events", {"room_id": "room"}),
+}
+
+
+def plan_stages(plan) -> set[str]:
+    """Names of all stages of an explained plan, whatever the server version nests them in."""
+    if isinstance(plan, list):
+        return set().union(*(plan_stages(item) for item in plan))
+    if not isinstance(plan, dict):
+        return set()
+    stages = {plan["stage"]} if isinstance(plan.get("stage"), str) else set()
+    return stages.union(*(plan_stages(value) for value in plan.values()))
+
+
+def assert_uses_index(explained: dict):
+    stages = plan_stages(explained)
+    assert "COLLSCAN" not in stages
+    assert any("IXSCAN" in stage or "IDHACK" in stage for stage in stages), stages
+
+
+@pytest.mark.parametrize(("collection", "query"), QUERIES.values(), ids=QUERIES.keys())
+def test_query_uses_index(mongo_database, collection, query):
+    ensure_indexes(mongo_database)
+    assert_uses_index(mongo_database.get_collection(collection).find(query).explain())
+
+
+def test_random_room_uses_index(mongo_database):
+    ensure_indexes(mongo_database)
+    explained = mongo_database.command("aggregate", "game_rooms", pipeline=random_room_pipeline(), explain=True)
+    assert_uses_index(explained)
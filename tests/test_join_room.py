@@ -0,0 +1,51 @@
+import asyncio
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db import async_routines
+from ai_mafia.db.models import PlayerModel
+
+N_JOINERS = 100
+
+
+async def racing_joiners(room_db_id, join):
+    users = [await async_routines.add_user(tg_id, f"player{tg_id}") for tg_id in range(N_JOINERS)]
+    # every user clicks twice, so that duplicates race as well
+    attempts = [user for user in users for _ in range(2)]
+    return await asyncio.gather(*(join(user, room_db_id) for user in attempts))
+
+
+def assert_seats(room):
+    user_ids = [player.user_id for player in room.list_players]
+    assert len(user_ids) == MAX_PLAYERS
+    assert len(set(user_ids)) == MAX_PLAYERS
+
+
+def test_concurrent_joiners(any_storage):
+    async def join(user, room_db_id):
+        return await async_routines.join_room(user.db_id, room_db_id, user.tg_id, user.tg_id)
+
+    async def scenario():
+        room = await async_routines.add_room("test")
+        results = await racing_joiners(room.db_id, join)
+        assert_seats(await any_storage.rooms.find_by_db_id(room.db_id))
+        # a user seated by the first click gets the room back on the second one
+        assert sum(result is not None for result in results) == 2 * MAX_PLAYERS
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_joiners_without_matchmaker(any_storage):
+    """The storage alone must keep the room from overfilling, e.g. when other processes join too."""
+
+    async def join(user, room_db_id):
+        player = PlayerModel(user_id=str(user.db_id), ctx_id=user.tg_id, chat_id=user.tg_id)
+        return await any_storage.rooms.join(player, room_db_id)
+
+    async def scenario():
+        room = await async_routines.add_room("test")
+        results = await racing_joiners(room.db_id, join)
+        assert_seats(await any_storage.rooms.find_by_db_id(room.db_id))
+        # here a repeated join is rejected
+        assert sum(result is not None for result in results) == MAX_PLAYERS
+
+    asyncio.run(scenario())
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+import urllib.parse
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import telegram as tg
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from ai_mafia.config import TelegramConfig
+from ai_mafia.tg_proxy.outbox import Outbox, Priority
+
+
+class FakeBotAPI:
+    """
+    Local stand-in for the Telegram Bot API. Records sent messages,
+    answers 429 once to texts in `rate_limited`, 400 to texts in `rejected`
+    and a result the library cannot parse to texts in `malformed`.
+    """
+
+    def __init__(
+        self,
+        rate_limited: frozenset[str] = frozenset(),
+        rejected: frozenset[str] = frozenset(),
+        malformed: frozenset[str] = frozenset(),
+    ):
+        self.rate_limited = set(rate_limited)
+        self.rejected = rejected
+        self.malformed = malformed
+        self.received: list[tuple[int, str]] = []
+        self.limited_at: dict[str, float] = {}
+        self.received_at: dict[str, float] = {}
+        self.app = FastAPI()
+        self.app.post("/bot{token}/{method}")(self.handle)
+
+    async def handle(self, method: str, request: Request):
+        body = await request.body()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = dict(urllib.parse.parse_qsl(body.decode()))
+        if method == "getMe":
+            return {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}}
+        chat_id, text = int(data["chat_id"]), data["text"]
+        if text in self.rate_limited:
+            self.rate_limited.discard(text)
+            self.limited_at[text] = time.monotonic()
+            error = {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests",
+                "parameters": {"retry_after": 1},
+            }
+            return JSONResponse(error, status_code=429)
+        if text in self.rejected:
+            return JSONResponse({"ok": False, "error_code": 400, "description": "Bad Request"}, status_code=400)
+        if text in self.malformed:
+            return {"ok": True, "result": "not a message"}
+        self.received.append((chat_id, text))
+        self.received_at[text] = time.monotonic()
+        message = {"message_id": len(self.received), "date": 0, "chat": {"id": chat_id, "type": "private"}}
+        return {"ok": True, "result": {**message, "text": text}}
+
+    @asynccontextmanager
+    async def serve(self):
+        """Run the server on a free local port and yield the base url for :py:class:`telegram.Bot`."""
+        server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:  # noqa: ASYNC110 uvicorn has no event for it
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        try:
+            yield f"http://127.0.0.1:{port}/bot"
+        finally:
+            server.should_exit = True
+            await serving
+
+    def texts(self, chat_id: int) -> list[str]:
+        return [text for chat, text in self.received if chat == chat_id]
+
+
+async def deliver(api: FakeBotAPI, messages: list[tuple[int, str, Priority]], **config):
+    """Queue `messages` before the outbox starts sending, then wait until all of them are done."""
+    async with api.serve() as base_url, tg.Bot("1:test", base_url=base_url) as bot:
+        outbox = Outbox(bot, TelegramConfig(**config))
+        futures = [outbox.send(chat_id, text, priority) for chat_id, text, priority in messages]
+        sender = asyncio.create_task(outbox.run())
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*futures), timeout=10)
+        finally:
+            sender.cancel()
+        return outbox, results
+
+
+def test_retry_after():
+    api = FakeBotAPI(rate_limited=frozenset({"first"}))
+    messages = [(1, "first", Priority.NORMAL), (1, "second", Priority.NORMAL), (2, "other chat", Priority.NORMAL)]
+    outbox, results = asyncio.run(deliver(api, messages))
+
+    assert all(result is not None for result in results)
+    assert api.texts(1) == ["first", "second"]
+    assert api.received_at["first"] - api.limited_at["first"] >= 1
+    # only the limited chat waits
+    assert api.received_at["other chat"] < api.received_at["first"]
+    assert outbox.stats()["rate_limited"] == 1
+    assert outbox.stats()["sent"] == 3
+
+
+def test_critical_messages_go_first():
+    messages = [
+        (1, "normal 1", Priority.NORMAL),
+        (1, "normal 2", Priority.NORMAL),
+        (1, "critical 1", Priority.CRITICAL),
+        (1, "critical 2", Priority.CRITICAL),
+    ]
+    api = FakeBotAPI()
+    asyncio.run(deliver(api, messages))
+
+    assert api.texts(1) == ["critical 1", "critical 2", "normal 1", "normal 2"]
+
+
+def test_order_within_chat():
+    messages = [(chat_id, f"{chat_id}-{i}", Priority.NORMAL) for i in range(5) for chat_id in range(3)]
+    api = FakeBotAPI(rate_limited=frozenset({"0-1", "2-0"}))
+    asyncio.run(deliver(api, messages, chat_rate_limit=20, chat_burst=2))
+
+    for chat_id in range(3):
+        assert api.texts(chat_id) == [f"{chat_id}-{i}" for i in range(5)]
+
+
+def test_rejected_message_is_dropped():
+    api = FakeBotAPI(rejected=frozenset({"bad"}))
+    outbox, results = asyncio.run(deliver(api, [(1, "bad", Priority.NORMAL), (1, "good", Priority.NORMAL)]))
+
+    assert results[0] is None
+    assert results[1] is not None
+    assert outbox.stats()["failed"] == 1
+
+
+def test_unexpected_error_fails_the_message():
+    api = FakeBotAPI(malformed=frozenset({"malformed"}))
+    messages = [(1, "malformed", Priority.NORMAL), (1, "next", Priority.NORMAL)]
+    outbox, results = asyncio.run(deliver(api, messages))
+
+    assert results[0] is None
+    assert results[1] is not None
+    assert outbox.stats()["failed"] == 1
+
+
+def test_cancelled_send_fails_the_message():
+    async def hang(**_):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        outbox = Outbox(SimpleNamespace(send_message=hang), TelegramConfig())
+        future = outbox.send(1, "never sent")
+        sender = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.05)
+        for task in outbox._sending:
+            task.cancel()
+        try:
+            return await asyncio.wait_for(future, timeout=1)
+        finally:
+            sender.cancel()
+
+    assert asyncio.run(scenario()) is None
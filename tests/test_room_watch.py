@@ -0,0 +1,46 @@
+import asyncio
+
+from ai_mafia.db import async_routines
+from ai_mafia.db.cache import room_cache
+from ai_mafia.db.matchmaking import matchmaker
+from ai_mafia.types import RoomState
+
+
+def test_stale_changes_are_dropped(memory_storage, monkeypatch):
+    async def scenario():
+        room = await async_routines.add_room("test")
+        user = await async_routines.add_user(1, "player")
+        joined = await async_routines.join_room(user.db_id, room.db_id, user.tg_id, user.tg_id)
+        started = joined.model_copy(update={"room_state": RoomState.STARTED, "version": joined.version + 1})
+
+        async def watch():
+            # changes of other processes may be delivered after this process has seen a later write
+            for change in [started, joined, room]:
+                yield change.db_id, change
+
+        monkeypatch.setattr(memory_storage.rooms, "watch", watch)
+        await async_routines.watch_room_changes()
+        return started
+
+    started = asyncio.run(scenario())
+    assert started.db_id not in matchmaker
+    assert room_cache.version(started.db_id) is None  # the cache is cleared when the stream ends
+
+
+def test_cache_keeps_the_newest_room(memory_storage, monkeypatch):
+    async def scenario():
+        room = await async_routines.add_room("test")
+        newer = room.model_copy(update={"name": "renamed", "version": room.version + 2})
+        older = room.model_copy(update={"name": "stale", "version": room.version + 1})
+        seen = []
+
+        async def watch():
+            for change in [newer, older]:
+                yield change.db_id, change
+                seen.append(room_cache.get(room.room_id).name)
+
+        monkeypatch.setattr(memory_storage.rooms, "watch", watch)
+        await async_routines.watch_room_changes()
+        return seen
+
+    assert asyncio.run(scenario()) == ["renamed", "renamed"]
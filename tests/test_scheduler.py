@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from ai_mafia.tg_proxy.scheduler import PhaseScheduler
+
+
+async def run_timers(schedule, wait: float = 0.2) -> list[str]:
+    scheduler = PhaseScheduler()
+    fired = []
+
+    def record(name: str):
+        async def callback():
+            fired.append(name)
+
+        return callback
+
+    runner = asyncio.create_task(scheduler.run())
+    schedule(scheduler, record)
+    await asyncio.sleep(wait)
+    runner.cancel()
+    assert len(scheduler) == 0
+    return fired
+
+
+def test_timers_fire_in_deadline_order():
+    def schedule(scheduler, record):
+        now = time.time()
+        for i, delay in enumerate([0.09, 0.03, 0.06]):
+            scheduler.schedule(f"room{i}", now + delay, record(f"room{i}"))
+        assert len(scheduler) == 3
+
+    assert asyncio.run(run_timers(schedule)) == ["room1", "room2", "room0"]
+
+
+def test_timer_is_replaced_and_cancelled():
+    def schedule(scheduler, record):
+        now = time.time()
+        scheduler.schedule("room", now + 0.05, record("old"))
+        scheduler.schedule("room", now + 0.1, record("new"))
+        scheduler.schedule("cancelled", now + 0.05, record("cancelled"))
+        assert scheduler.cancel("cancelled")
+        assert not scheduler.cancel("cancelled")
+        assert len(scheduler) == 1
+
+    assert asyncio.run(run_timers(schedule)) == ["new"]
+
+
+def test_failed_callback_does_not_stop_other_timers():
+    def schedule(scheduler, record):
+        async def fail():
+            raise RuntimeError
+
+        now = time.time()
+        scheduler.schedule("failing", now + 0.01, fail)
+        scheduler.schedule("room", now + 0.05, record("room"))
+
+    assert asyncio.run(run_timers(schedule)) == ["room"]
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from ai_mafia.db import async_routines
+from ai_mafia.types import PlayerState, RoomState
+
+from .test_concurrency import seat_players
+
+
+async def finish_game(storage):
+    """Start a game and kill the mafia in storage, behind the back of the caller's copy of the room."""
+    room, users = await seat_players(10)
+    for user in users:
+        await async_routines.set_player_state(user.db_id, room.db_id, PlayerState.READY)
+    assert await async_routines.start_game(room.db_id)
+    started = await storage.rooms.find_by_db_id(room.db_id)
+    for player in storage.rooms._rooms[room.db_id].list_players:
+        if player.role.is_black():
+            player.state = PlayerState.DEAD
+    return started, users
+
+
+def counters(storage, users) -> list[tuple[int, int]]:
+    stored = [storage.users._users[user.db_id] for user in users]
+    return [(user.game_counter, user.win_counter) for user in stored]
+
+
+def test_game_is_settled_once(memory_storage):
+    async def scenario():
+        stale_room, users = await finish_game(memory_storage)
+        assert stale_room.is_black_win() is None
+        settled = await asyncio.gather(*(async_routines.settle_game(stale_room) for _ in users))
+        assert sum(room is not None for room in settled) == 1
+        assert await async_routines.settle_game(stale_room) is None
+        ended = await memory_storage.rooms.find_by_db_id(stale_room.db_id)
+        assert ended.room_state == RoomState.ENDED
+        assert ended.settled
+        reds = [not player.role.is_black() for player in ended.list_players]
+        assert counters(memory_storage, users) == [(1, int(red)) for red in reds]
+
+    asyncio.run(scenario())
+
+
+def test_settling_is_retried_after_failure(memory_storage, monkeypatch):
+    async def scenario():
+        room, users = await finish_game(memory_storage)
+
+        async def fail(_):
+            raise ConnectionError
+
+        with monkeypatch.context() as patch:
+            patch.setattr(memory_storage.rooms, "end_game", fail)
+            with pytest.raises(ConnectionError):
+                await async_routines.settle_game(room)
+        stored = await memory_storage.rooms.find_by_db_id(room.db_id)
+        assert stored.room_state == RoomState.STARTED
+        assert stored.settled
+
+        assert await async_routines.settle_game(room)
+        assert sum(games for games, _ in counters(memory_storage, users)) == len(users)
+
+    asyncio.run(scenario())
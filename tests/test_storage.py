@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from ai_mafia.constants import MAX_PLAYERS
+from ai_mafia.db.models import PlayerModel, RoomModel
+from ai_mafia.types import PlayerRole, RoomState
+
+
+def player(i: int) -> PlayerModel:
+    return PlayerModel(user_id=f"user{i}", ctx_id=i, chat_id=i)
+
+
+async def add_room(storage, n_players: int = 0) -> RoomModel:
+    room_db_id = await storage.rooms.insert(RoomModel(name="test", room_id=f"room{n_players}"))
+    for i in range(n_players):
+        await storage.rooms.join(player(i), room_db_id)
+    return await storage.rooms.find_by_db_id(room_db_id)
+
+
+def test_join_conditions(memory_storage):
+    async def scenario():
+        rooms = memory_storage.rooms
+        room = await add_room(memory_storage, MAX_PLAYERS - 1)
+        assert await rooms.join(player(0), room.db_id) is None
+        assert await rooms.join(player(MAX_PLAYERS), room.db_id) is not None
+        assert await rooms.join(player(MAX_PLAYERS + 1), room.db_id) is None
+
+        room = await add_room(memory_storage, 1)
+        await rooms.start_game(room.db_id, PlayerRole.all_roles())
+        assert await rooms.join(player(2), room.db_id) is None
+
+    asyncio.run(scenario())
+
+
+def test_shoot_unknown_number(memory_storage):
+    async def scenario():
+        room = await add_room(memory_storage, MAX_PLAYERS)
+        await memory_storage.rooms.start_game(room.db_id, PlayerRole.all_roles())
+        assert await memory_storage.rooms.shoot(room.db_id, MAX_PLAYERS + 1) is None
+        shot = await memory_storage.rooms.shoot(room.db_id, 1)
+        assert shot.list_players[0].shoot_cnt == 1
+
+    asyncio.run(scenario())
+
+
+def test_returned_rooms_are_detached(memory_storage):
+    async def scenario():
+        room = await add_room(memory_storage, 1)
+        room.list_players.clear()
+        stored = await memory_storage.rooms.find_by_db_id(room.db_id)
+        assert len(stored.list_players) == 1
+
+    asyncio.run(scenario())
+
+
+def test_compare_and_set(memory_storage):
+    async def scenario():
+        rooms = memory_storage.rooms
+        room = await add_room(memory_storage)
+        updated = await rooms.compare_and_set(room.db_id, room.version, {"phase": "night"})
+        assert updated.version == room.version + 1
+        # a writer that has read the room before the first one loses
+        assert await rooms.compare_and_set(room.db_id, room.version, {"phase": "day"}) is None
+
+    asyncio.run(scenario())
+
+
+def test_murder_returns_room_before_the_murder(memory_storage):
+    async def scenario():
+        rooms = memory_storage.rooms
+        room = await add_room(memory_storage, MAX_PLAYERS)
+        await rooms.start_game(room.db_id, PlayerRole.all_roles())
+        for _ in range(3):
+            await rooms.shoot(room.db_id, 1)
+        before = await rooms.murder(room.room_id)
+        after = await rooms.find_by_db_id(room.db_id)
+        assert before.list_players[0].shoot_cnt == 3
+        assert all(player.shoot_cnt == 0 for player in after.list_players)
+
+    asyncio.run(scenario())
+
+
+def test_maintenance(memory_storage):
+    async def scenario():
+        rooms = memory_storage.rooms
+        idle = await add_room(memory_storage, 1)
+        ended = await add_room(memory_storage, 2)
+        await rooms.start_game(ended.db_id, PlayerRole.all_roles())
+        await rooms.end_game(ended.db_id)
+        later = datetime.now(timezone.utc) + timedelta(seconds=1)
+
+        assert await rooms.archive_ended_rooms(later, limit=10) == [ended.db_id]
+        assert await rooms.expire_idle_rooms(later, limit=10) == [idle.db_id]
+        assert await rooms.find_all() == []
+        assert await rooms.find_by_state(RoomState.ENDED) == []
+
+    asyncio.run(scenario())
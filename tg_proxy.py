@@ -1,14 +1,21 @@
+import asyncio
 import logging
 import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Annotated
 
-import requests
-from chatsky import Message
+import uvicorn
 from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CallbackContext, CallbackQueryHandler, MessageHandler, filters
+from fastapi import FastAPI, Header, HTTPException, Request
+from telegram import Bot, Update
 
 from ai_mafia.config import load_config
-from ai_mafia.tg_proxy import tg_update_to_chatsky_message
+from ai_mafia.http_client import close_http_client
+from ai_mafia.tg_proxy import build_application
+
+if TYPE_CHECKING:
+    from telegram.ext import Application
 
 load_dotenv()
 
@@ -16,40 +23,63 @@ logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s
 logger = logging.getLogger(__name__)
 
 config = load_config().chatsky
+tg_config = load_config().telegram
 
+WEBHOOK_PATH = "/telegram"
 
-async def handle_message(update: Update, context: CallbackContext) -> None:
-    try:
-        msg = tg_update_to_chatsky_message(update).model_dump(mode="json")
-        response = requests.post(config.make_endpoint("chat"), json=msg, timeout=5)  # noqa: ASYNC210
-        response.raise_for_status()
-        msg = Message(**response.json())
-        keyboard = None
-        if hasattr(msg, "reply_markup"):
-            keyboard = msg.reply_markup
-        if update.callback_query is None:
-            await update.message.reply_text(msg.text, reply_markup=keyboard)
-        else:
-            query = update.callback_query
-            await query.answer()
-            await context.bot.edit_message_text(
-                chat_id=query.message.chat_id, text=msg.text, reply_markup=keyboard, message_id=query.message.message_id
-            )
-    except requests.exceptions.RequestException as e:
-        logger.exception("Error sending message to HTTP endpoint: %s", str(e))  # noqa: TRY401
-        if update.callback_query is None:
-            await update.message.reply_text("Failed to forward the message.")
-        else:
-            await update.callback_query.answer(text="Failed to forward the message.")
 
+@asynccontextmanager
+async def lifespan(webhook_app: FastAPI):
+    application = build_application(polling=False)
+    async with application:
+        await application.start()
+        webhook_app.state.application = application
+        yield
+        await application.stop()
+    await close_http_client()
+
+
+webhook_app = FastAPI(lifespan=lifespan)
+"""Receives updates in webhook mode. Every worker process runs its own copy with its own bot application."""
 
-def main() -> None:
-    app = ApplicationBuilder().token(os.environ["TG_TOKEN"]).build()
 
-    app.add_handler(MessageHandler(filters.TEXT, handle_message))
-    app.add_handler(CallbackQueryHandler(handle_message))
+@webhook_app.post(WEBHOOK_PATH)
+async def receive_update(
+    request: Request, x_telegram_bot_api_secret_token: Annotated[str | None, Header()] = None
+) -> None:
+    expected = os.environ["TG_WEBHOOK_SECRET"]
+    if x_telegram_bot_api_secret_token is None or not secrets.compare_digest(x_telegram_bot_api_secret_token, expected):
+        raise HTTPException(status_code=403)
+    application: Application = request.app.state.application
+    await application.update_queue.put(Update.de_json(await request.json(), application.bot))
 
-    app.run_polling()
+
+async def set_webhook() -> None:
+    """Tell Telegram where to post updates. Done once, not by every worker."""
+    async with Bot(os.environ["TG_TOKEN"]) as bot:
+        await bot.set_webhook(
+            tg_config.webhook_url,
+            secret_token=os.environ["TG_WEBHOOK_SECRET"],
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=tg_config.webhook_max_connections,
+        )
+
+
+def main() -> None:
+    if config.in_process:
+        logger.error("chatsky.in_process is set: updates are received by the script process, tg_proxy.py is not needed")
+        return
+    if tg_config.mode == "webhook":
+        asyncio.run(set_webhook())
+        uvicorn.run(
+            "tg_proxy:webhook_app",
+            host=tg_config.webhook_host,
+            port=tg_config.webhook_port,
+            workers=tg_config.webhook_workers,
+        )
+    else:
+        # polling removes the webhook if there is one
+        build_application().run_polling()
 
 
 if __name__ == "__main__":